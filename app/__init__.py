@@ -1,10 +1,10 @@
 from functools import wraps
-from flask import Flask
+from flask import Flask, current_app, g
 from flask.ext.bootstrap import Bootstrap
-from flask.ext.sqlalchemy import SQLAlchemy
 from dmutils import apiclient, init_app, flask_featureflags
 
 from config import configs
+from .database import SQLAlchemy
 
 bootstrap = Bootstrap()
 db = SQLAlchemy()
@@ -50,7 +50,32 @@ def isolation_level(level):
         @wraps(view)
         def view_wrapper(*args, **kwargs):
             if flask_featureflags.is_active('TRANSACTION_ISOLATION'):
-                db.session.connection(execution_options={'isolation_level': level})
+                if current_app.config['DM_DB_TRANSACTION_POOLING']:
+                    # The pooler shares server connections between clients,
+                    # so only set the level for this transaction
+                    db.session.execute("SET TRANSACTION ISOLATION LEVEL %s" % level)
+                else:
+                    db.session.connection(execution_options={'isolation_level': level})
             return view(*args, **kwargs)
         return view_wrapper
     return decorator
+
+
+def read_from_primary(view):
+    """Flask view decorator to read from the primary database in a GET view
+
+    GET views read from the replica by default when one is configured, which
+    may lag behind the primary. Use this for views that clients call to see
+    changes they've just made.
+
+    Usage::
+        @view("/thingy/<id>", methods=["GET"])
+        @read_from_primary
+        def get_thing(id):
+            ...
+    """
+    @wraps(view)
+    def view_wrapper(*args, **kwargs):
+        g.read_from_primary = True
+        return view(*args, **kwargs)
+    return view_wrapper
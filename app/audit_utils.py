@@ -0,0 +1,88 @@
+import threading
+import time
+
+from flask import current_app
+
+from .models import User
+
+
+class UserNameCache(object):
+    """Process-local cache of user names by email address
+
+    Audit events record the email address of the user that made the change.
+    Names are looked up for all the addresses that aren't cached in a single
+    query, and kept for `ttl` seconds. Addresses that don't belong to a user
+    are cached too, as None. The cache is emptied when it grows past
+    `max_size` addresses.
+    """
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._names = {}
+
+    def get_names(self, email_addresses):
+        now = time.time()
+        email_addresses = set(email for email in email_addresses if email)
+
+        with self._lock:
+            names = dict(
+                (email, self._names[email][0]) for email in email_addresses
+                if email in self._names and self._names[email][1] > now
+            )
+
+        missing = email_addresses - set(names)
+        if missing:
+            found = find_user_names(missing)
+
+            with self._lock:
+                if len(self._names) + len(missing) > self.max_size:
+                    self._names = {}
+                for email in missing:
+                    names[email] = found[email]
+                    self._names[email] = (names[email], now + self.ttl)
+
+        return names
+
+
+def find_user_names(email_addresses):
+    """Look up the names of the users with `email_addresses` in one query
+
+    Addresses that don't belong to a user map to None.
+    """
+    email_addresses = set(email for email in email_addresses if email)
+    if not email_addresses:
+        return {}
+
+    found = dict(User.query.filter(
+        User.email_address.in_(email_addresses)
+    ).with_entities(User.email_address, User.name))
+
+    return dict((email, found.get(email)) for email in email_addresses)
+
+
+def get_user_name_cache():
+    if 'user_name_cache' not in current_app.extensions:
+        current_app.extensions['user_name_cache'] = UserNameCache(
+            current_app.config['DM_USER_NAME_CACHE_TTL'],
+            current_app.config['DM_USER_NAME_CACHE_SIZE'],
+        )
+    return current_app.extensions['user_name_cache']
+
+
+def serialize_audit_events(audit_events, include_user=False, cached=True):
+    """Serialize audit events, adding the name of each event's user with
+    `include_user`
+
+    The names for all the events are looked up together, through the
+    process's `UserNameCache` unless `cached` is False.
+    """
+    user_names = None
+    if include_user:
+        email_addresses = [audit_event.user for audit_event in audit_events]
+        if cached:
+            user_names = get_user_name_cache().get_names(email_addresses)
+        else:
+            user_names = find_user_names(email_addresses)
+
+    return [audit_event.serialize(user_names=user_names) for audit_event in audit_events]
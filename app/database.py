@@ -0,0 +1,110 @@
+import threading
+import time
+
+from flask import g, request, has_request_context
+from flask.ext import sqlalchemy as flask_sqlalchemy
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+from sqlalchemy.sql.expression import Select, CompoundSelect
+
+
+REPLICA_BIND = 'replica'
+
+
+class MonitoredQueuePool(QueuePool):
+    """QueuePool that counts checkouts and the time spent waiting for them
+
+    The wait time includes opening a new connection when the pool is
+    below its size, as well as waiting for a connection to be returned
+    when the pool and its overflow are all checked out.
+    """
+    def __init__(self, *args, **kwargs):
+        super(MonitoredQueuePool, self).__init__(*args, **kwargs)
+        self._counters_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _do_get(self):
+        start = time.time()
+        timed_out = False
+        try:
+            return super(MonitoredQueuePool, self)._do_get()
+        except TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            waited = time.time() - start
+            with self._counters_lock:
+                self.checkouts += 1
+                self.timeouts += timed_out
+                self.wait_time += waited
+                self.max_wait_time = max(self.max_wait_time, waited)
+
+    def status_counters(self):
+        with self._counters_lock:
+            return {
+                'mode': 'queue',
+                'size': self.size(),
+                'checkedIn': self.checkedin(),
+                'checkedOut': self.checkedout(),
+                'overflow': max(self.overflow(), 0),
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'waitTime': round(self.wait_time, 6),
+                'maxWaitTime': round(self.max_wait_time, 6),
+            }
+
+
+class RoutingSession(flask_sqlalchemy.SignallingSession):
+    """Session that sends SELECTs in GET requests to the read replica
+
+    Only used when a 'replica' bind is configured. Everything else goes to
+    the primary: requests that may write, views decorated with
+    `read_from_primary`, and any statement that isn't a SELECT. Once the
+    session has flushed changes it stays on the primary, so it reads its
+    own writes.
+    """
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing:
+            self.info['wrote'] = True
+        elif self._reads_from_replica() and isinstance(clause, (Select, CompoundSelect)):
+            return flask_sqlalchemy.get_state(self.app).db.get_engine(self.app, bind=REPLICA_BIND)
+
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+    def _reads_from_replica(self):
+        return (
+            REPLICA_BIND in (self.app.config['SQLALCHEMY_BINDS'] or {}) and
+            not self.info.get('wrote') and
+            has_request_context() and
+            request.method in ['GET', 'HEAD'] and
+            not g.get('read_from_primary')
+        )
+
+
+class SQLAlchemy(flask_sqlalchemy.SQLAlchemy):
+    """Flask-SQLAlchemy with the engine pool configured by the app, and
+    reads routed to the replica by `RoutingSession`
+
+    With `DM_DB_TRANSACTION_POOLING` the app connects through an external
+    transaction pooler such as pgbouncer, so it doesn't keep a pool of its
+    own and connections are closed when they're returned.
+    """
+    def create_session(self, options):
+        return RoutingSession(self, **options)
+
+    def apply_pool_defaults(self, app, options):
+        if app.config.get('DM_DB_TRANSACTION_POOLING'):
+            options['poolclass'] = NullPool
+        else:
+            options['poolclass'] = MonitoredQueuePool
+            super(SQLAlchemy, self).apply_pool_defaults(app, options)
+
+
+def get_pool_status(engine):
+    pool = engine.pool
+    if isinstance(pool, MonitoredQueuePool):
+        return pool.status_counters()
+    return {'mode': 'transaction' if isinstance(pool, NullPool) else pool.__class__.__name__}
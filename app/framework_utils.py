@@ -0,0 +1,248 @@
+import datetime
+import threading
+import time
+
+from flask import current_app, abort
+from sqlalchemy import case, func, inspect, or_, orm
+from sqlalchemy.types import String
+
+from . import db
+from .models import AuditEvent, DraftService, Framework, FrameworkStats, Lot, Supplier, SupplierFramework, User
+
+
+FRAMEWORK_STATS_REFRESH_STATUSES = ['open', 'pending']
+
+
+class FrameworkRegistry(object):
+    """Process-local copies of all frameworks and their lots
+
+    Frameworks are read on most requests but only change a few times a
+    year, so they're loaded in one query and kept for `ttl` seconds. The
+    copies aren't attached to any session: they're merged into the current
+    session when they're looked up, which doesn't query the database. A
+    framework the session has already loaded is returned as it is.
+
+    Each process has its own copies, so a framework update made by another
+    process is only seen once the copies expire.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._by_slug = {}
+        self._by_id = {}
+
+    def _load(self):
+        session = orm.Session(bind=db.engine)
+        try:
+            frameworks = session.query(Framework).order_by(Framework.id).all()
+        finally:
+            session.close()
+
+        self._by_slug = dict((framework.slug, framework) for framework in frameworks)
+        self._by_id = dict((framework.id, framework) for framework in frameworks)
+        self._loaded_at = time.time()
+
+    def _frameworks(self):
+        with self._lock:
+            if self._loaded_at is None or time.time() - self._loaded_at >= self.ttl:
+                self._load()
+            return self._by_slug, self._by_id
+
+    def _merge(self, framework):
+        if framework is None:
+            return None
+
+        # The session's own instance may be newer than our copy, so it
+        # mustn't be overwritten with it
+        in_session = db.session.identity_map.get(inspect(framework).key)
+        if in_session is not None:
+            return in_session
+        return db.session.merge(framework, load=False)
+
+    def get_by_slug(self, slug):
+        return self._merge(self._frameworks()[0].get(slug))
+
+    def get_by_id(self, framework_id):
+        return self._merge(self._frameworks()[1].get(framework_id))
+
+    def get_all(self):
+        return [self._merge(framework) for _, framework in sorted(self._frameworks()[1].items())]
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+
+def get_framework_registry():
+    if 'framework_registry' not in current_app.extensions:
+        current_app.extensions['framework_registry'] = FrameworkRegistry(
+            current_app.config['DM_FRAMEWORK_REGISTRY_TTL']
+        )
+    return current_app.extensions['framework_registry']
+
+
+def get_framework_or_404(framework_slug):
+    framework = get_framework_registry().get_by_slug(framework_slug)
+    if framework is None:
+        abort(404)
+    return framework
+
+
+class FrameworkStatsCache(object):
+    """Process-local copies of framework stats
+
+    Stats are loaded with `load(framework)` and kept for `ttl` seconds.
+    Only one thread in the process loads a framework's stats at a time:
+    while it does, other requests get the expired stats if there are any,
+    or wait for the new ones. Stats that `load` returns as None aren't
+    cached.
+    """
+    def __init__(self, ttl, load):
+        self.ttl = ttl
+        self.load = load
+        self._lock = threading.Lock()
+        self._refresh_locks = {}
+        self._stats = {}
+
+    def get(self, framework):
+        cached = self._stats.get(framework.id)
+        if cached is not None and cached[1] > time.time():
+            return cached[0]
+
+        with self._lock:
+            refresh_lock = self._refresh_locks.setdefault(framework.id, threading.Lock())
+
+        if not refresh_lock.acquire(cached is None):
+            return cached[0]
+        try:
+            cached = self._stats.get(framework.id)
+            if cached is not None and cached[1] > time.time():
+                return cached[0]
+
+            stats = self.load(framework)
+            if stats is not None:
+                self._stats[framework.id] = (stats, time.time() + self.ttl)
+            return stats
+        finally:
+            refresh_lock.release()
+
+
+def get_framework_stats_cache():
+    """Return the framework stats cache for the current app
+
+    With `DM_FRAMEWORK_STATS_REFRESH` set to 'background' the stats are read
+    from the `framework_stats` table, which is kept up to date by the
+    `refresh_framework_stats` command, so requests never calculate them.
+    Otherwise they're calculated by the first request after they expire.
+    """
+    if 'framework_stats_cache' not in current_app.extensions:
+        if current_app.config['DM_FRAMEWORK_STATS_REFRESH'] == 'background':
+            load = read_framework_stats
+        else:
+            load = calculate_framework_stats
+
+        current_app.extensions['framework_stats_cache'] = FrameworkStatsCache(
+            current_app.config['DM_FRAMEWORK_STATS_TTL'], load
+        )
+    return current_app.extensions['framework_stats_cache']
+
+
+def read_framework_stats(framework):
+    framework_stats = FrameworkStats.query.get(framework.id)
+    return framework_stats.stats if framework_stats is not None else None
+
+
+def refresh_framework_stats():
+    """Calculate and store the stats for each framework that's open or
+    pending, or that has no stats yet, and return their slugs
+    """
+    frameworks = Framework.query.outerjoin(
+        FrameworkStats, FrameworkStats.framework_id == Framework.id
+    ).filter(or_(
+        Framework.status.in_(FRAMEWORK_STATS_REFRESH_STATUSES),
+        FrameworkStats.framework_id.is_(None)
+    )).order_by(Framework.id).all()
+
+    for framework in frameworks:
+        db.session.merge(FrameworkStats(
+            framework_id=framework.id,
+            stats=calculate_framework_stats(framework),
+            calculated_at=datetime.datetime.utcnow()
+        ))
+        db.session.commit()
+
+    return [framework.slug for framework in frameworks]
+
+
+def calculate_framework_stats(framework):
+    """Count the framework's drafts, interested suppliers and supplier users"""
+    seven_days_ago = datetime.datetime.utcnow() + datetime.timedelta(-7)
+
+    has_completed_drafts_query = db.session.query(
+        DraftService.supplier_id, func.min(DraftService.id)
+    ).filter(
+        DraftService.framework_id == framework.id,
+        DraftService.status == 'submitted'
+    ).group_by(
+        DraftService.supplier_id
+    ).subquery('completed_drafts')
+
+    drafts_alias = orm.aliased(DraftService, has_completed_drafts_query)
+
+    def label_columns(labels, query):
+        return [
+            dict(zip(labels, item))
+            for item in sorted(query, key=lambda x: list(map(str, x)))
+        ]
+
+    is_declaration_complete = case([
+        (SupplierFramework.declaration['status'].cast(String) == 'complete', True)
+    ], else_=False)
+
+    return {
+        'services': label_columns(
+            ['status', 'lot', 'declaration_made', 'count'],
+            db.session.query(
+                DraftService.status, Lot.slug, is_declaration_complete, func.count()
+            ).outerjoin(
+                SupplierFramework, DraftService.supplier_id == SupplierFramework.supplier_id
+            ).join(
+                Lot, DraftService.lot_id == Lot.id
+            ).group_by(
+                DraftService.status, Lot.slug, is_declaration_complete
+            ).filter(
+                DraftService.framework_id == framework.id
+            ).all()
+        ),
+        'supplier_users': label_columns(
+            ['recent_login', 'count'],
+            db.session.query(
+                User.logged_in_at > seven_days_ago, func.count()
+            ).filter(
+                User.role == 'supplier'
+            ).group_by(
+                User.logged_in_at > seven_days_ago
+            ).all()
+        ),
+        'interested_suppliers': label_columns(
+            ['declaration_status', 'has_completed_services', 'count'],
+            db.session.query(
+                SupplierFramework.declaration['status'].cast(String),
+                drafts_alias.supplier_id.isnot(None), func.count()
+            ).select_from(
+                Supplier
+            ).outerjoin(
+                AuditEvent, AuditEvent.object_id == Supplier.id
+            ).outerjoin(
+                SupplierFramework
+            ).outerjoin(
+                drafts_alias
+            ).filter(
+                AuditEvent.object_type == 'Supplier',
+                AuditEvent.type == 'register_framework_interest'
+            ).group_by(
+                SupplierFramework.declaration['status'].cast(String), drafts_alias.supplier_id.isnot(None)
+            ).all()
+        )
+    }
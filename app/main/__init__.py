@@ -1,10 +1,13 @@
 from flask import Blueprint
 
 from ..authentication import requires_authentication
+from ..utils import compress_response, log_db_queries
 
 main = Blueprint('main', __name__)
 
 main.before_request(requires_authentication)
+main.after_request(compress_response)
+main.after_request(log_db_queries)
 
 
 @main.after_request
@@ -1,16 +1,18 @@
-from flask import jsonify, abort, request, current_app
-from datetime import datetime
+from flask import json, jsonify, abort, request, current_app, Response, stream_with_context
+from datetime import datetime, timedelta
 from ...models import AuditEvent
-from sqlalchemy import asc, Date, cast
+from sqlalchemy import asc, tuple_
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.sql.expression import true, false
-from ...utils import pagination_links, get_valid_page_or_1
+from ...utils import pagination_links, keyset_pagination_links, get_valid_page_or_1, get_valid_after_id_or_none
 from .. import main
 from ... import db, models
 from dmutils.audit import AuditTypes
 from dmutils.config import convert_to_boolean
+from dmutils.formats import DATE_FORMAT
 from ...validation import is_valid_date, is_valid_acknowledged_state
 from ...service_utils import validate_and_return_updater_request
+from ...audit_utils import serialize_audit_events
 from ...utils import get_json_from_request, json_has_required_keys
 
 
@@ -30,20 +32,103 @@ AUDIT_OBJECT_ID_FIELDS = {
 @main.route('/audit-events', methods=['GET'])
 def list_audits():
     page = get_valid_page_or_1()
+    after_id = get_valid_after_id_or_none()
     try:
         per_page = int(request.args.get('per_page', current_app.config['DM_API_SERVICES_PAGE_SIZE']))
     except ValueError:
         abort(400, 'invalid page size supplied')
 
-    audits = AuditEvent.query.order_by(
-        asc(AuditEvent.created_at)
+    include_user = convert_to_boolean(request.args.get('include_user', 'false'))
+    if not isinstance(include_user, bool):
+        abort(400, 'invalid include_user value supplied')
+
+    audits = filter_audits_by_request_args(AuditEvent.query).order_by(
+        asc(AuditEvent.created_at), asc(AuditEvent.id)
+    )
+
+    if after_id is not None:
+        return list_audits_after_id(audits, after_id, per_page, include_user)
+
+    audits = audits.paginate(
+        page=page,
+        per_page=per_page
+    )
+
+    return jsonify(
+        auditEvents=serialize_audit_events(audits.items, include_user),
+        links=pagination_links(
+            audits,
+            '.list_audits',
+            request.args
+        )
+    )
+
+
+@main.route('/audit-events/export', methods=['GET'])
+def export_audits():
+    """
+    Streams all audit events matching the `list_audits` filters as
+    newline-delimited JSON, ordered by created_at and id.
+
+    Rows are read from a server-side cursor in batches, so memory use
+    doesn't grow with the number of events.
+    :return: one serialized audit event per line
+    """
+    audits = filter_audits_by_request_args(AuditEvent.query).order_by(
+        asc(AuditEvent.created_at), asc(AuditEvent.id)
+    ).yield_per(
+        current_app.config['DM_API_AUDIT_EVENTS_EXPORT_BATCH_SIZE']
+    )
+
+    def generate():
+        for audit in audits:
+            yield json.dumps(audit.serialize()) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def list_audits_after_id(audits, after_id, per_page, include_user):
+    """Return the page of audit events following `after_id`, in
+    (created_at, id) order
+
+    `after_id=0` starts from the first event. Otherwise `after_id` must be
+    an existing audit event, whose created_at is looked up by id. One extra
+    row is fetched to find out whether there is a next page, so there's no
+    OFFSET scan or COUNT query however far into the events the page is.
+    """
+    if after_id:
+        after_created_at = db.session.query(AuditEvent.created_at).filter(
+            AuditEvent.id == after_id
+        ).scalar()
+        if after_created_at is None:
+            abort(400, "Invalid after_id argument: audit event {} does not exist".format(after_id))
+        audits = audits.filter(
+            tuple_(AuditEvent.created_at, AuditEvent.id) > tuple_(after_created_at, after_id)
+        )
+
+    items = audits.limit(per_page + 1).all()
+    items, has_next = items[:per_page], len(items) > per_page
+
+    return jsonify(
+        auditEvents=serialize_audit_events(items, include_user),
+        links=keyset_pagination_links(
+            items[-1].id if has_next else None,
+            '.list_audits',
+            request.args
+        )
     )
 
+
+def filter_audits_by_request_args(audits):
     audit_date = request.args.get('audit-date', None)
     if audit_date:
         if is_valid_date(audit_date):
+            # A range on created_at itself, unlike casting it to a date,
+            # can use the (created_at, id) index
+            audit_datetime = datetime.strptime(audit_date, DATE_FORMAT)
             audits = audits.filter(
-                cast(AuditEvent.created_at, Date) == audit_date
+                AuditEvent.created_at >= audit_datetime,
+                AuditEvent.created_at < audit_datetime + timedelta(days=1)
             )
         else:
             abort(400, 'invalid audit date supplied')
@@ -86,19 +171,7 @@ def list_audits():
     elif object_id:
         abort(400, 'object-id cannot be provided without object-type')
 
-    audits = audits.paginate(
-        page=page,
-        per_page=per_page
-    )
-
-    return jsonify(
-        auditEvents=[audit.serialize() for audit in audits.items],
-        links=pagination_links(
-            audits,
-            '.list_audits',
-            request.args
-        )
-    )
+    return audits
 
 
 @main.route('/audit-events', methods=['POST'])
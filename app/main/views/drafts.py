@@ -5,9 +5,9 @@ from sqlalchemy.exc import IntegrityError
 from sqlalchemy import asc, desc
 
 from .. import main
-from ... import db, isolation_level
+from ... import db, isolation_level, read_from_primary
 from ...validation import is_valid_service_id_or_400
-from ...models import Service, DraftService, Supplier, AuditEvent, Framework
+from ...models import Service, DraftService, Supplier, AuditEvent
 from ...service_utils import (
     validate_and_return_updater_request,
     update_and_validate_service, index_service,
@@ -16,10 +16,13 @@ from ...service_utils import (
     get_service_validation_errors
 )
 
+from ...audit_utils import serialize_audit_events
 from ...draft_utils import (
     validate_and_return_draft_request,
     get_request_page_questions
 )
+from ...utils import with_etag
+from ...framework_utils import get_framework_registry
 
 
 @main.route('/draft-services/copy-from/<string:service_id>', methods=['PUT'])
@@ -112,6 +115,7 @@ def edit_draft_service(draft_id):
 
 
 @main.route('/draft-services', methods=['GET'])
+@read_from_primary
 def list_draft_services():
     supplier_id = request.args.get('supplier_id')
     service_id = request.args.get('service_id')
@@ -136,9 +140,7 @@ def list_draft_services():
         services = services.filter(DraftService.service_id == service_id)
 
     if framework_slug:
-        framework = Framework.query.filter(
-            Framework.slug == framework_slug
-        ).first()
+        framework = get_framework_registry().get_by_slug(framework_slug)
         services = services.filter(DraftService.framework_id == framework.id)
 
     items = services.filter(DraftService.supplier_id == supplier_id).all()
@@ -149,6 +151,8 @@ def list_draft_services():
 
 
 @main.route('/draft-services/<int:draft_id>', methods=['GET'])
+@read_from_primary
+@with_etag
 def fetch_draft_service(draft_id):
     """
     Return a draft service
@@ -171,7 +175,8 @@ def fetch_draft_service(draft_id):
 
     return jsonify(
         services=draft.serialize(),
-        auditEvents=last_audit_event.serialize(include_user=True),
+        # Read from the primary, so don't show a cached user name either
+        auditEvents=serialize_audit_events([last_audit_event], include_user=True, cached=False)[0],
         validationErrors=get_service_validation_errors(draft)
     )
 
@@ -239,6 +244,7 @@ def publish_draft_service(draft_id):
     else:
         service_from_draft = create_service_from_draft(draft, "published")
 
+    index_service(service_from_draft)
     commit_and_archive_service(service_from_draft, update_details,
                                AuditTypes.publish_draft_service,
                                audit_data={'draftId': draft_id})
@@ -258,8 +264,6 @@ def publish_draft_service(draft_id):
                 extra=dict(
                     action=action, draft_id=draft_id, service_id=service_from_draft.service_id, error=e.message)))
 
-    index_service(service_from_draft)
-
     return jsonify(services=service_from_draft.serialize()), 200
 
 
@@ -1,21 +1,19 @@
 from flask import jsonify, abort, request
-from sqlalchemy.types import String
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import func, orm, case
-import datetime
 
 from dmutils.audit import AuditTypes
 from dmutils.config import convert_to_boolean
 from .. import main
 from ...models import (
-    db, Framework, DraftService, User, Supplier, SupplierFramework, AuditEvent, Lot, ValidationError
+    db, Framework, SupplierFramework, AuditEvent, ValidationError, Service, SerializedService
 )
-from ...utils import get_json_from_request, json_has_required_keys, json_only_has_required_keys
+from ...utils import get_json_from_request, json_has_required_keys, json_only_has_required_keys, with_etag
+from ...framework_utils import get_framework_registry, get_framework_or_404, get_framework_stats_cache
 
 
 @main.route('/frameworks', methods=['GET'])
 def list_frameworks():
-    frameworks = Framework.query.all()
+    frameworks = get_framework_registry().get_all()
 
     return jsonify(
         frameworks=[f.serialize() for f in frameworks]
@@ -23,10 +21,9 @@ def list_frameworks():
 
 
 @main.route('/frameworks/<string:framework_slug>', methods=['GET'])
+@with_etag
 def get_framework(framework_slug):
-    framework = Framework.query.filter(
-        Framework.slug == framework_slug
-    ).first_or_404()
+    framework = get_framework_or_404(framework_slug)
 
     return jsonify(frameworks=framework.serialize())
 
@@ -44,6 +41,7 @@ def update_framework(framework_slug):
     try:
         framework.status = json_payload['frameworks']['status']
         db.session.add(framework)
+        SerializedService.invalidate(Service.framework_id == framework.id)
         db.session.add(
             AuditEvent(
                 audit_type=AuditTypes.framework_update,
@@ -56,91 +54,25 @@ def update_framework(framework_slug):
         db.session.rollback()
         abort(400, "Validation Error: {}".format(e))
 
+    get_framework_registry().invalidate()
+
     return jsonify(frameworks=framework.serialize())
 
 
 @main.route('/frameworks/<string:framework_slug>/stats', methods=['GET'])
 def get_framework_stats(framework_slug):
-    framework = Framework.query.filter(
-        Framework.slug == framework_slug
-    ).first_or_404()
+    framework = get_framework_or_404(framework_slug)
 
-    seven_days_ago = datetime.datetime.utcnow() + datetime.timedelta(-7)
-
-    has_completed_drafts_query = db.session.query(
-        DraftService.supplier_id, func.min(DraftService.id)
-    ).filter(
-        DraftService.framework_id == framework.id,
-        DraftService.status == 'submitted'
-    ).group_by(
-        DraftService.supplier_id
-    ).subquery('completed_drafts')
-
-    drafts_alias = orm.aliased(DraftService, has_completed_drafts_query)
-
-    def label_columns(labels, query):
-        return [
-            dict(zip(labels, item))
-            for item in sorted(query, key=lambda x: list(map(str, x)))
-        ]
-
-    is_declaration_complete = case([
-        (SupplierFramework.declaration['status'].cast(String) == 'complete', True)
-    ], else_=False)
-
-    return jsonify({
-        'services': label_columns(
-            ['status', 'lot', 'declaration_made', 'count'],
-            db.session.query(
-                DraftService.status, Lot.slug, is_declaration_complete, func.count()
-            ).outerjoin(
-                SupplierFramework, DraftService.supplier_id == SupplierFramework.supplier_id
-            ).join(
-                Lot, DraftService.lot_id == Lot.id
-            ).group_by(
-                DraftService.status, Lot.slug, is_declaration_complete
-            ).filter(
-                DraftService.framework_id == framework.id
-            ).all()
-        ),
-        'supplier_users': label_columns(
-            ['recent_login', 'count'],
-            db.session.query(
-                User.logged_in_at > seven_days_ago, func.count()
-            ).filter(
-                User.role == 'supplier'
-            ).group_by(
-                User.logged_in_at > seven_days_ago
-            ).all()
-        ),
-        'interested_suppliers': label_columns(
-            ['declaration_status', 'has_completed_services', 'count'],
-            db.session.query(
-                SupplierFramework.declaration['status'].cast(String),
-                drafts_alias.supplier_id.isnot(None), func.count()
-            ).select_from(
-                Supplier
-            ).outerjoin(
-                AuditEvent, AuditEvent.object_id == Supplier.id
-            ).outerjoin(
-                SupplierFramework
-            ).outerjoin(
-                drafts_alias
-            ).filter(
-                AuditEvent.object_type == 'Supplier',
-                AuditEvent.type == 'register_framework_interest'
-            ).group_by(
-                SupplierFramework.declaration['status'].cast(String), drafts_alias.supplier_id.isnot(None)
-            ).all()
-        )
-    })
+    stats = get_framework_stats_cache().get(framework)
+    if stats is None:
+        abort(503, "Stats for '{}' haven't been calculated yet".format(framework_slug))
+
+    return jsonify(stats)
 
 
 @main.route('/frameworks/<string:framework_slug>/suppliers', methods=['GET'])
 def get_framework_suppliers(framework_slug):
-    framework = Framework.query.filter(
-        Framework.slug == framework_slug
-    ).first_or_404()
+    framework = get_framework_or_404(framework_slug)
 
     agreement_returned = request.args.get('agreement_returned')
 
@@ -165,13 +97,11 @@ def get_framework_suppliers(framework_slug):
 
 @main.route('/frameworks/<string:framework_slug>/interest', methods=['GET'])
 def get_framework_interest(framework_slug):
-    framework = Framework.query.filter(
-        Framework.slug == framework_slug
-    ).first_or_404()
+    framework = get_framework_or_404(framework_slug)
 
-    supplier_frameworks = SupplierFramework.query.filter(
+    supplier_frameworks = db.session.query(SupplierFramework.supplier_id).filter(
         SupplierFramework.framework_id == framework.id
-    ).order_by(SupplierFramework.supplier_id).all()
+    ).order_by(SupplierFramework.supplier_id)
 
     supplier_ids = [supplier_framework.supplier_id for supplier_framework in supplier_frameworks]
 
@@ -1,13 +1,19 @@
+import re
+
 from dmutils.audit import AuditTypes
+from dmutils.config import convert_to_boolean
 
-from flask import jsonify, abort, request, current_app
+from flask import json, jsonify, abort, request, current_app, Response, stream_with_context
 
 from .. import main
-from ...models import ArchivedService, Service, Supplier
+from ... import db
+from ...models import ArchivedService, Service, Supplier, Framework, Lot, ValidationError
 
-from sqlalchemy import asc
+from sqlalchemy import and_, asc, orm
 from ...validation import is_valid_service_id_or_400
-from ...utils import url_for, pagination_links, display_list, get_valid_page_or_1
+from ...utils import url_for, pagination_links, display_list, get_valid_page_or_1, \
+    get_valid_after_id_or_none, get_valid_fields_or_none, keyset_pagination_links, page_links, \
+    get_json_from_request, json_has_required_keys, with_etag
 
 from ...service_utils import (
     validate_and_return_service_request,
@@ -18,9 +24,19 @@ from ...service_utils import (
     commit_and_archive_service,
     validate_service_data,
     validate_and_return_related_objects,
+    serialize_services,
+    serialize_service_fields,
+    get_related_objects_for_services,
+    service_from_import_json,
+    commit_and_archive_services,
 )
 
 
+SUPPLIER_SERVICE_SUMMARY_FIELDS = [
+    'id', 'serviceName', 'frameworkSlug', 'frameworkName', 'lot', 'lotName', 'status', 'updatedAt'
+]
+
+
 @main.route('/')
 def index():
     """Entry point for the API, show the resources that are available."""
@@ -36,20 +52,27 @@ def index():
 @main.route('/services', methods=['GET'])
 def list_services():
     page = get_valid_page_or_1()
+    after_id = get_valid_after_id_or_none()
 
     supplier_id = request.args.get('supplier_id')
 
-    if request.args.get('framework'):
-        services = Service.query.has_frameworks(*[
-            slug.strip() for slug in request.args['framework'].split(',')
-        ])
+    summary = convert_to_boolean(request.args.get('summary', 'false'))
+    if not isinstance(summary, bool):
+        abort(400, "Invalid summary argument")
+    if summary and supplier_id is None:
+        abort(400, "summary can only be used with supplier_id")
+
+    fields = get_valid_fields_or_none()
+    if fields:
+        services = Service.query.with_fields(*fields)
+
+        def serialize(rows):
+            return serialize_service_fields(rows, fields)
     else:
-        services = Service.query.framework_is_live()
+        services = Service.query.with_serialized_data()
+        serialize = serialize_services
 
-    if request.args.get('status'):
-        services = services.has_statuses(*[
-            status.strip() for status in request.args['status'].split(',')
-        ])
+    services = filter_services_by_request_args(services)
 
     if supplier_id is not None:
         try:
@@ -57,25 +80,35 @@ def list_services():
         except ValueError:
             abort(400, "Invalid supplier_id: %s" % supplier_id)
 
+        # A supplier's services aren't ordered by id, so there's no after_id cursor
+        if after_id is not None:
+            abort(400, "after_id can't be used with supplier_id")
+
+        if summary:
+            return list_supplier_services_page(services, supplier_id, page, fields)
+
         supplier = Supplier.query.filter(Supplier.supplier_id == supplier_id).all()
         if not supplier:
             abort(404, "supplier_id '%d' not found" % supplier_id)
 
         items = services.default_order().filter(Service.supplier_id == supplier_id).all()
         return jsonify(
-            services=[service.serialize() for service in items],
+            services=serialize(items),
             links=dict()
         )
     else:
         services = services.order_by(asc(Service.id))
 
+    if after_id is not None:
+        return list_services_after_id(services, after_id, serialize)
+
     services = services.paginate(
         page=page,
         per_page=current_app.config['DM_API_SERVICES_PAGE_SIZE'],
     )
 
     return jsonify(
-        services=[service.serialize() for service in services.items],
+        services=serialize(services.items),
         links=pagination_links(
             services,
             '.list_services',
@@ -84,6 +117,135 @@ def list_services():
     )
 
 
+def filter_services_by_request_args(services):
+    if request.args.get('framework'):
+        services = services.has_frameworks(*[
+            slug.strip() for slug in request.args['framework'].split(',')
+        ])
+    else:
+        services = services.framework_is_live()
+
+    if request.args.get('status'):
+        services = services.has_statuses(*[
+            status.strip() for status in request.args['status'].split(',')
+        ])
+
+    for key, values in request.args.lists():
+        if not key.startswith('filter['):
+            continue
+
+        match = re.match(r'^filter\[([A-Za-z0-9_]+)\]$', key)
+        if not match:
+            abort(400, "Invalid filter argument: {}".format(key))
+
+        for value in values:
+            if match.group(1) == 'lot':
+                services = services.has_lots(value)
+            else:
+                services = services.data_contains(match.group(1), value)
+
+    return services
+
+
+def list_supplier_services_page(services, supplier_id, page, fields):
+    """Return a page of a supplier's services with only `fields`, or the
+    summary fields, for each service
+
+    The supplier is outer joined to its services in the same statement, so
+    there's no separate query to check that it exists: no rows means there's
+    no such supplier, and a row without a service means it has no services
+    matching the filters. Services are ordered to match the
+    `ix_services_supplier_order` index, and one extra row is fetched to
+    find out whether there is a next page instead of counting them.
+    """
+    if page < 1:
+        abort(400, "Invalid page argument")
+
+    fields = fields or SUPPLIER_SERVICE_SUMMARY_FIELDS
+    per_page = current_app.config['DM_API_SERVICES_PAGE_SIZE']
+
+    # Moving the filters into the join condition keeps the supplier row
+    # when none of its services match
+    service_filter = Service.supplier_id == Supplier.supplier_id
+    if services.whereclause is not None:
+        service_filter = and_(service_filter, services.whereclause)
+
+    rows = db.session.query(
+        Service.id, *[Service.field_column(field) for field in fields]
+    ).select_from(Supplier).outerjoin(
+        Service, service_filter
+    ).outerjoin(
+        Framework, Framework.id == Service.framework_id
+    ).outerjoin(
+        Lot, Lot.id == Service.lot_id
+    ).filter(
+        Supplier.supplier_id == supplier_id
+    ).order_by(
+        Service.framework_id, Service.lot_id, Service.data['serviceName'].astext, Service.id
+    ).offset((page - 1) * per_page).limit(per_page + 1).all()
+
+    if not rows:
+        if page == 1:
+            abort(404, "supplier_id '%d' not found" % supplier_id)
+        abort(404, "Page not found")
+
+    items = [row for row in rows[:per_page] if row[0] is not None]
+
+    return jsonify(
+        services=serialize_service_fields(items, fields),
+        links=page_links(page, len(rows) > per_page, '.list_services', request.args)
+    )
+
+
+def list_services_after_id(services, after_id, serialize):
+    """Return the page of services following `after_id`, ordered by Service.id
+
+    Fetches one extra row to find out whether there is a next page, so
+    there's no OFFSET scan or COUNT query regardless of how far into the
+    list the page is.
+    """
+    per_page = current_app.config['DM_API_SERVICES_PAGE_SIZE']
+
+    items = services.filter(Service.id > after_id).limit(per_page + 1).all()
+    items, has_next = items[:per_page], len(items) > per_page
+
+    return jsonify(
+        services=serialize(items),
+        links=keyset_pagination_links(
+            items[-1].id if has_next else None,
+            '.list_services',
+            request.args
+        )
+    )
+
+
+@main.route('/services/export', methods=['GET'])
+def export_services():
+    """
+    Streams all services matching the `framework` and `status` filters
+    as newline-delimited JSON, ordered by Service.id.
+
+    Rows are read from a server-side cursor in batches, so memory use
+    doesn't grow with the size of the catalogue.
+    :return: one serialized service per line
+    """
+    services = filter_services_by_request_args(Service.query).order_by(
+        asc(Service.id)
+    ).options(
+        # joined collection loads can't be combined with yield_per
+        orm.defaultload(Service.framework).lazyload(Framework.lots),
+        orm.defaultload(Service.supplier).lazyload(Supplier.contact_information),
+    ).yield_per(
+        current_app.config['DM_API_SERVICES_EXPORT_BATCH_SIZE']
+    )
+
+    def generate():
+        for service in services:
+            yield json.dumps(service.serialize()) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 @main.route('/archived-services', methods=['GET'])
 def list_archived_services_by_service_id():
     """
@@ -136,9 +298,9 @@ def update_service(service_id):
 
     updated_service = update_and_validate_service(service, update)
 
+    index_service(updated_service)
     commit_and_archive_service(updated_service, update_details,
                                AuditTypes.update_service)
-    index_service(updated_service)
 
     return jsonify(message="done"), 200
 
@@ -177,22 +339,74 @@ def import_service(service_id):
 
     validate_service_data(service)
 
-    commit_and_archive_service(service, updater_json, AuditTypes.import_service)
     index_service(service)
+    commit_and_archive_service(service, updater_json, AuditTypes.import_service)
 
     return jsonify(services=service.serialize()), 201
 
 
+@main.route('/services', methods=['PUT'])
+def import_services():
+    """Import a batch of services from legacy digital marketplace
+
+    Frameworks, lots and suppliers are looked up once for the whole batch
+    and the valid services are inserted together. Services that can't be
+    imported are reported in the response and don't stop the others.
+    :return: a result for each service, in the order they were sent, with
+             status 201 if any service was created and 400 otherwise
+    """
+    updater_json = validate_and_return_updater_request()
+    json_payload = get_json_from_request()
+    json_has_required_keys(json_payload, ['services'])
+    services_json = json_payload['services']
+
+    if not isinstance(services_json, list) or not all(isinstance(item, dict) for item in services_json):
+        abort(400, "Invalid JSON; 'services' must be a list of services")
+    if len(services_json) > current_app.config['DM_API_SERVICES_IMPORT_BATCH_SIZE']:
+        abort(400, "Too many services; the limit is {}".format(
+            current_app.config['DM_API_SERVICES_IMPORT_BATCH_SIZE']))
+
+    frameworks, suppliers = get_related_objects_for_services(services_json)
+    existing_service_ids = set(service_id for service_id, in db.session.query(Service.service_id).filter(
+        Service.service_id.in_([str(item.get('id')) for item in services_json])
+    ))
+
+    results = []
+    new_services = []
+    new_service_ids = set()
+    for service_json in services_json:
+        service_id = str(service_json.get('id'))
+        try:
+            if service_id in existing_service_ids:
+                raise ValidationError("Cannot update service by PUT")
+            if service_id in new_service_ids:
+                raise ValidationError("Service ID '{}' appears more than once".format(service_id))
+            new_services.append(service_from_import_json(service_json, frameworks, suppliers))
+            new_service_ids.add(service_id)
+            results.append({'id': service_id, 'result': 'created'})
+        except ValidationError as e:
+            results.append({'id': service_id, 'result': 'error', 'error': e.message})
+
+    if new_services:
+        for service in new_services:
+            index_service(service)
+        commit_and_archive_services(new_services, updater_json, AuditTypes.import_service)
+
+    return jsonify(services=results), 201 if new_services else 400
+
+
 @main.route('/services/<string:service_id>', methods=['GET'])
+@with_etag
 def get_service(service_id):
     service = Service.query.filter(
         Service.service_id == service_id
-    ).first_or_404()
+    ).with_serialized_data().first_or_404()
 
-    return jsonify(services=service.serialize())
+    return jsonify(services=serialize_services([service])[0])
 
 
 @main.route('/archived-services/<int:archived_service_id>', methods=['GET'])
+@with_etag
 def get_archived_service(archived_service_id):
     """
     Retrieves a service from the archived_service by PK
@@ -244,11 +458,6 @@ def update_service_status(service_id, status):
 
     prior_status, service.status = service.status, status
 
-    commit_and_archive_service(service, update_json,
-                               AuditTypes.update_service_status,
-                               audit_data={'old_status': prior_status,
-                                           'new_status': status})
-
     if prior_status != status:
 
         # If it's being unpublished, delete it from the search api.
@@ -258,4 +467,9 @@ def update_service_status(service_id, status):
             # If it's being published, index in the search api.
             index_service(service)
 
+    commit_and_archive_service(service, update_json,
+                               AuditTypes.update_service_status,
+                               audit_data={'old_status': prior_status,
+                                           'new_status': status})
+
     return jsonify(services=service.serialize()), 200
@@ -3,17 +3,19 @@ from flask import jsonify, abort, request, current_app
 from sqlalchemy import func, orm
 from sqlalchemy.exc import IntegrityError, DataError
 from .. import main
-from ... import db
-from ...models import Supplier, ContactInformation, AuditEvent, Service, DraftService, SupplierFramework, Framework
+from ... import db, read_from_primary
+from ...models import Supplier, ContactInformation, AuditEvent, Service, DraftService, SupplierFramework, Framework, \
+    SerializedService, SupplierLiveFramework
 from ...validation import (
     validate_supplier_json_or_400,
     validate_contact_information_json_or_400,
     is_valid_string_or_400
 )
 from ...utils import pagination_links, drop_foreign_fields, get_json_from_request, \
-    json_has_required_keys, json_has_matching_id, get_valid_page_or_1
+    json_has_required_keys, json_has_matching_id, get_valid_page_or_1, get_valid_fields_or_none, with_etag
 from ...service_utils import validate_and_return_updater_request
-from ...supplier_utils import validate_and_return_supplier_request
+from ...supplier_utils import validate_and_return_supplier_request, serialize_supplier_fields
+from ...framework_utils import get_framework_or_404
 from dmutils.audit import AuditTypes
 
 
@@ -27,18 +29,20 @@ def list_suppliers():
 
     duns_number = request.args.get('duns_number')
 
+    fields = get_valid_fields_or_none()
+    if fields:
+        columns = [Supplier.field_column(field) for field in fields]
+        if any(column is None for column in columns):
+            abort(400, "Invalid fields argument: unknown supplier fields '{}'".format(
+                "', '".join(field for field, column in zip(fields, columns) if column is None)))
+
+    suppliers = Supplier.query.order_by(Supplier.name, Supplier.supplier_id)
+
     if framework:
         is_valid_string_or_400(framework)
-
-        suppliers = Supplier.query.join(
-            Service.supplier, Service.framework
-        ).filter(
-            Framework.status == 'live',
-            Framework.framework == framework,
-            Service.status == 'published'
-        ).order_by(Supplier.name, Supplier.supplier_id)
-    else:
-        suppliers = Supplier.query.order_by(Supplier.name, Supplier.supplier_id)
+        suppliers = suppliers.filter(
+            Supplier.supplier_id.in_(suppliers_on_live_framework(framework))
+        )
 
     if duns_number:
         is_valid_string_or_400(duns_number)
@@ -49,13 +53,18 @@ def list_suppliers():
     if prefix:
         if prefix == 'other':
             suppliers = suppliers.filter(
-                Supplier.name.op('~')('^[^A-Za-z]'))
+                Supplier.name_initial == Supplier.OTHER_NAME_INITIAL)
         else:
-            # case insensitive LIKE comparison for matching supplier names
+            name_initial = Supplier.name_initial_of(prefix)
             suppliers = suppliers.filter(
-                Supplier.name.ilike(prefix + '%'))
+                Supplier.name_initial == name_initial)
+            if prefix.upper() != name_initial:
+                # case insensitive LIKE comparison for matching supplier names
+                suppliers = suppliers.filter(
+                    Supplier.name.ilike(prefix + '%'))
 
-    suppliers = suppliers.distinct(Supplier.name, Supplier.supplier_id)
+    if fields:
+        suppliers = suppliers.with_entities(*columns)
 
     try:
         suppliers = suppliers.paginate(
@@ -63,8 +72,13 @@ def list_suppliers():
             per_page=current_app.config['DM_API_SUPPLIERS_PAGE_SIZE'],
         )
 
+        if fields:
+            items = serialize_supplier_fields(suppliers.items, fields)
+        else:
+            items = [supplier.serialize() for supplier in suppliers.items]
+
         return jsonify(
-            suppliers=[supplier.serialize() for supplier in suppliers.items],
+            suppliers=items,
             links=pagination_links(
                 suppliers,
                 '.list_suppliers',
@@ -74,7 +88,53 @@ def list_suppliers():
         abort(400, 'invalid framework')
 
 
+def suppliers_on_live_framework(framework):
+    """Select the ids of suppliers with published services on a live
+    framework of the `framework` type
+    """
+    return db.session.query(SupplierLiveFramework.supplier_id).join(
+        Framework, Framework.id == SupplierLiveFramework.framework_id
+    ).filter(
+        Framework.status == 'live',
+        Framework.framework == framework
+    )
+
+
+@main.route('/suppliers/initials', methods=['GET'])
+def list_supplier_initials():
+    """Count suppliers by the initial of their name, for each page of the
+    A to Z directory
+
+    Takes the same `framework` argument as `list_suppliers`. Names that don't
+    start with a letter are counted under 'other'.
+    """
+    framework = request.args.get('framework')
+
+    counts = db.session.query(
+        Supplier.name_initial, func.count(Supplier.supplier_id)
+    ).group_by(Supplier.name_initial)
+
+    if framework:
+        is_valid_string_or_400(framework)
+        counts = counts.filter(
+            Supplier.supplier_id.in_(suppliers_on_live_framework(framework))
+        )
+
+    try:
+        counts = counts.all()
+    except DataError:
+        abort(400, 'invalid framework')
+
+    initials = dict((chr(letter), 0) for letter in range(ord('A'), ord('Z') + 1))
+    initials['other'] = 0
+    for name_initial, count in counts:
+        initials['other' if name_initial == Supplier.OTHER_NAME_INITIAL else name_initial] = count
+
+    return jsonify(initials=initials)
+
+
 @main.route('/suppliers/<int:supplier_id>', methods=['GET'])
+@with_etag
 def get_supplier(supplier_id):
     supplier = Supplier.query.filter(
         Supplier.supplier_id == supplier_id
@@ -118,6 +178,7 @@ def import_supplier(supplier_id):
         db.session.add(supplier)
 
     try:
+        SerializedService.invalidate(Service.supplier_id == supplier.supplier_id)
         db.session.commit()
     except IntegrityError as e:
         db.session.rollback()
@@ -188,6 +249,7 @@ def update_supplier(supplier_id):
     )
 
     try:
+        SerializedService.invalidate(Service.supplier_id == supplier.supplier_id)
         db.session.commit()
     except IntegrityError as e:
         db.session.rollback()
@@ -241,9 +303,7 @@ def update_contact_information(supplier_id, contact_id):
 
 @main.route('/suppliers/<supplier_id>/frameworks/<framework_slug>/declaration', methods=['PUT'])
 def set_a_declaration(supplier_id, framework_slug):
-    framework = Framework.query.filter(
-        Framework.slug == framework_slug
-    ).first_or_404()
+    framework = get_framework_or_404(framework_slug)
 
     supplier_framework = SupplierFramework.find_by_supplier_and_framework(
         supplier_id, framework_slug
@@ -285,21 +345,19 @@ def set_a_declaration(supplier_id, framework_slug):
 
 
 @main.route('/suppliers/<supplier_id>/frameworks/interest', methods=['GET'])
+@read_from_primary
 def get_registered_frameworks(supplier_id):
-    supplier_frameworks = SupplierFramework.query.filter(
+    slugs = db.session.query(Framework.slug).join(
+        SupplierFramework, SupplierFramework.framework_id == Framework.id
+    ).filter(
         SupplierFramework.supplier_id == supplier_id
-    ).all()
-    slugs = []
-    for framework in supplier_frameworks:
-        framework = Framework.query.filter(
-            Framework.id == framework.framework_id
-        ).first()
-        slugs.append(framework.slug)
+    ).order_by(Framework.id)
 
-    return jsonify(frameworks=slugs)
+    return jsonify(frameworks=[slug for slug, in slugs])
 
 
 @main.route('/suppliers/<supplier_id>/frameworks', methods=['GET'])
+@read_from_primary
 def get_supplier_frameworks_info(supplier_id):
     supplier = Supplier.query.filter(
         Supplier.supplier_id == supplier_id
@@ -322,6 +380,7 @@ def get_supplier_frameworks_info(supplier_id):
 
 
 @main.route('/suppliers/<supplier_id>/frameworks/<framework_slug>', methods=['GET'])
+@read_from_primary
 def get_supplier_framework_info(supplier_id, framework_slug):
     supplier_framework = SupplierFramework.find_by_supplier_and_framework(
         supplier_id, framework_slug
@@ -336,9 +395,7 @@ def get_supplier_framework_info(supplier_id, framework_slug):
 def register_framework_interest(supplier_id, framework_slug):
     updater_json = validate_and_return_updater_request()
 
-    framework = Framework.query.filter(
-        Framework.slug == framework_slug
-    ).first_or_404()
+    framework = get_framework_or_404(framework_slug)
 
     supplier = Supplier.query.filter(
         Supplier.supplier_id == supplier_id
@@ -349,7 +406,7 @@ def register_framework_interest(supplier_id, framework_slug):
     if json_payload:
         abort(400, "This PUT endpoint does not take a payload.")
 
-    interest_record = SupplierFramework.query.filter(
+    interest_record = SupplierFramework.query_without_relationships().filter(
         SupplierFramework.supplier_id == supplier.supplier_id,
         SupplierFramework.framework_id == framework.id
     ).first()
@@ -385,9 +442,7 @@ def register_framework_interest(supplier_id, framework_slug):
 def update_supplier_framework_details(supplier_id, framework_slug):
     updater_json = validate_and_return_updater_request()
 
-    framework = Framework.query.filter(
-        Framework.slug == framework_slug
-    ).first_or_404()
+    framework = get_framework_or_404(framework_slug)
 
     supplier = Supplier.query.filter(
         Supplier.supplier_id == supplier_id
@@ -397,7 +452,7 @@ def update_supplier_framework_details(supplier_id, framework_slug):
     json_has_required_keys(json_payload, ["frameworkInterest"])
     update_json = json_payload["frameworkInterest"]
 
-    interest_record = SupplierFramework.query.filter(
+    interest_record = SupplierFramework.query_without_relationships().filter(
         SupplierFramework.supplier_id == supplier.supplier_id,
         SupplierFramework.framework_id == framework.id
     ).first()
@@ -4,7 +4,7 @@ from sqlalchemy.exc import IntegrityError, DataError
 from flask import jsonify, abort, request, current_app
 
 from .. import main
-from ... import db, encryption
+from ... import db, encryption, read_from_primary
 from ...models import User, AuditEvent, Supplier
 from ...utils import get_json_from_request, json_has_required_keys, \
     json_has_matching_id, pagination_links, get_valid_page_or_1
@@ -39,6 +39,7 @@ def auth_user():
 
 
 @main.route('/users/<int:user_id>', methods=['GET'])
+@read_from_primary
 def get_user_by_id(user_id):
     user = User.query.filter(
         User.id == user_id
@@ -47,6 +48,7 @@ def get_user_by_id(user_id):
 
 
 @main.route('/users', methods=['GET'])
+@read_from_primary
 def list_users():
     user_query = User.query.order_by(User.id)
     page = get_valid_page_or_1()
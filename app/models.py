@@ -1,13 +1,16 @@
+import json
 import random
+import re
 from datetime import datetime
 
 from flask import current_app
 from flask_sqlalchemy import BaseQuery
 from sqlalchemy import asc
 from sqlalchemy import func
-from sqlalchemy.dialects.postgresql import JSON
+from sqlalchemy import and_, or_, event, exists, inspect, literal, select
+from sqlalchemy.dialects.postgresql import JSON, JSONB
 from sqlalchemy.ext.declarative import declared_attr
-from sqlalchemy.orm import validates
+from sqlalchemy.orm import lazyload, validates, Session
 from sqlalchemy.types import String
 from sqlalchemy import Sequence
 from sqlalchemy_utils import generic_relationship
@@ -190,6 +193,12 @@ class Supplier(db.Model):
 
     name = db.Column(db.String(255), nullable=False)
 
+    # Upper case first letter of the name, or OTHER_NAME_INITIAL if the name
+    # doesn't start with a letter. Set with the name.
+    name_initial = db.Column(db.String(1), nullable=False)
+
+    OTHER_NAME_INITIAL = '#'
+
     description = db.Column(db.String, index=False,
                             unique=False, nullable=True)
 
@@ -204,16 +213,28 @@ class Supplier(db.Model):
 
     companies_house_number = db.Column(db.String, index=False, unique=False, nullable=True)
 
-    clients = db.Column(JSON, default=list)
+    clients = db.Column(JSONB, default=list)
+
+    @staticmethod
+    def name_initial_of(name):
+        if name and re.match(r'[A-Za-z]', name):
+            return name[0].upper()
+        return Supplier.OTHER_NAME_INITIAL
+
+    @validates('name')
+    def validates_name(self, key, value):
+        self.name_initial = self.name_initial_of(value)
+        return value
 
     # Drop this method once the supplier front end is using SupplierFramework counts
     def get_service_counts(self):
         services = db.session.query(
-            Framework.name, func.count(Framework.name)
-        ).join(Service.framework).filter(
+            Framework.name, func.sum(ServiceCount.count)
+        ).join(ServiceCount, ServiceCount.framework_id == Framework.id).filter(
             Framework.status == 'live',
-            Service.status == 'published',
-            Service.supplier_id == self.supplier_id
+            ServiceCount.supplier_id == self.supplier_id,
+            ServiceCount.status == 'published',
+            ServiceCount.kind == 'service'
         ).group_by(Framework.name).all()
 
         return dict(services)
@@ -221,6 +242,21 @@ class Supplier(db.Model):
     def get_link(self):
         return url_for(".get_supplier", supplier_id=self.supplier_id)
 
+    @staticmethod
+    def field_column(field):
+        """Return the column a serialized supplier key is read from, or None
+        if the key doesn't come from a single column.
+        """
+        return {
+            'id': Supplier.supplier_id,
+            'name': Supplier.name,
+            'description': Supplier.description,
+            'dunsNumber': Supplier.duns_number,
+            'eSourcingId': Supplier.esourcing_id,
+            'companiesHouseNumber': Supplier.companies_house_number,
+            'clients': Supplier.clients,
+        }.get(field)
+
     def serialize(self, data=None):
         links = link(
             "self", self.get_link()
@@ -258,6 +294,49 @@ class Supplier(db.Model):
         return self
 
 
+class SupplierLiveFramework(db.Model):
+    """A framework that a supplier has at least one published service on
+
+    Lets the supplier directory find the suppliers on a framework without
+    joining services. Rows are kept up to date as services are flushed, by
+    `update_supplier_live_frameworks`; the directory still checks that the
+    framework itself is live.
+    """
+    __tablename__ = 'supplier_live_frameworks'
+
+    supplier_id = db.Column(db.BigInteger, db.ForeignKey('suppliers.supplier_id'), primary_key=True)
+    framework_id = db.Column(db.Integer, db.ForeignKey('frameworks.id'), primary_key=True, index=True)
+
+
+class FrameworkStats(db.Model):
+    """The stats last calculated for a framework by `refresh_framework_stats`"""
+    __tablename__ = 'framework_stats'
+
+    framework_id = db.Column(db.Integer, db.ForeignKey('frameworks.id'), primary_key=True)
+    stats = db.Column(JSONB, nullable=False)
+    calculated_at = db.Column(db.DateTime, nullable=False)
+
+
+class ServiceCount(db.Model):
+    """The number of a supplier's services or drafts in each lot and status
+
+    `kind` is 'service' or 'draft'. Rows are kept up to date as services
+    and drafts are flushed, by `update_service_counts`, and only exist for
+    non-zero counts. `check_service_counts` compares them with the services
+    and drafts tables.
+    """
+    __tablename__ = 'service_counts'
+
+    KINDS = ('service', 'draft')
+
+    supplier_id = db.Column(db.BigInteger, db.ForeignKey('suppliers.supplier_id'), primary_key=True)
+    framework_id = db.Column(db.Integer, db.ForeignKey('frameworks.id'), primary_key=True)
+    lot_id = db.Column(db.Integer, db.ForeignKey('lots.id'), primary_key=True)
+    status = db.Column(db.String, primary_key=True)
+    kind = db.Column(db.String, primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+
+
 class SupplierFramework(db.Model):
     __tablename__ = 'supplier_frameworks'
 
@@ -267,13 +346,23 @@ class SupplierFramework(db.Model):
     framework_id = db.Column(db.Integer,
                              db.ForeignKey('frameworks.id'),
                              primary_key=True)
-    declaration = db.Column(JSON)
+    declaration = db.Column(JSONB)
     on_framework = db.Column(db.Boolean, nullable=True)
     agreement_returned_at = db.Column(db.DateTime, index=False, unique=False, nullable=True)
 
     supplier = db.relationship(Supplier, lazy='joined', innerjoin=True)
     framework = db.relationship(Framework, lazy='joined', innerjoin=True)
 
+    @staticmethod
+    def query_without_relationships():
+        """Query supplier frameworks without joining their supplier and framework
+
+        For lookups that only need the supplier_frameworks columns. The
+        relationships are still loaded if they're used, from the session if
+        the supplier or framework is already there.
+        """
+        return SupplierFramework.query.options(lazyload('*'))
+
     @staticmethod
     def find_by_framework(framework_slug):
         return SupplierFramework.query.filter(
@@ -289,28 +378,21 @@ class SupplierFramework(db.Model):
 
     @staticmethod
     def get_service_counts(supplier_id):
-
-        count_services_query = db.session.query(
-            Service.framework_id, Service.status, func.count()
+        counts = db.session.query(
+            ServiceCount.kind, ServiceCount.framework_id, ServiceCount.status, func.sum(ServiceCount.count)
         ).filter(
-            Service.supplier_id == supplier_id
+            ServiceCount.supplier_id == supplier_id
         ).group_by(
-            Service.framework_id,
-            Service.status
-        ).all()
-
-        count_drafts_query = db.session.query(
-            DraftService.framework_id, DraftService.status, func.count()
-        ).filter(
-            DraftService.supplier_id == supplier_id
-        ).group_by(
-            DraftService.framework_id,
-            DraftService.status
+            ServiceCount.kind,
+            ServiceCount.framework_id,
+            ServiceCount.status
         ).all()
 
+        # Draft counts replace service counts with the same status
         return {
-            (row[0], row[1]): row[2]
-            for row in count_services_query + count_drafts_query
+            (row[1], row[2]): row[3]
+            for kind in ServiceCount.KINDS
+            for row in counts if row[0] == kind
         }
 
     def serialize(self, data=None):
@@ -413,7 +495,7 @@ class ServiceTableMixin(object):
     id = db.Column(db.Integer, primary_key=True)
     service_id = db.Column(db.String, index=True, unique=True, nullable=False)
 
-    data = db.Column(JSON)
+    data = db.Column(JSONB)
     status = db.Column(db.String, index=False, unique=False, nullable=False)
 
     created_at = db.Column(db.DateTime, index=False, nullable=False,
@@ -515,6 +597,10 @@ class ServiceTableMixin(object):
 class Service(db.Model, ServiceTableMixin):
     __tablename__ = 'services'
 
+    # The most recent archived copy, set by `commit_and_archive_service`
+    latest_archived_service_id = db.Column(db.Integer, db.ForeignKey('archived_services.id'), nullable=True)
+    latest_archived_service = db.relationship('ArchivedService', foreign_keys=[latest_archived_service_id])
+
     @staticmethod
     def create_from_draft(draft, status):
         return Service(
@@ -548,8 +634,153 @@ class Service(db.Model, ServiceTableMixin):
                 Service.framework.has(Framework.slug.in_(frameworks))
             )
 
+        def has_lots(self, *lots):
+            return self.filter(
+                Service.lot.has(Lot.slug.in_(lots))
+            )
+
+        def data_contains(self, key, value):
+            """Filter to services where `data[key]` is `value` or is a list
+            containing `value`.
+
+            `value` is a query string value, so a boolean or number in JSON
+            form also matches the boolean or number. Each alternative is a
+            `@>` containment test that can use the GIN index on `data`.
+            """
+            values = [value]
+            try:
+                # NaN and Infinity aren't valid in Postgres JSON
+                parsed_value = json.loads(value, parse_constant=lambda constant: None)
+                if isinstance(parsed_value, (bool, int, float)):
+                    values.append(parsed_value)
+            except ValueError:
+                pass
+
+            return self.filter(or_(*[
+                Service.data.contains({key: contained})
+                for contained in values + [[v] for v in values]
+            ]))
+
+        def with_serialized_data(self):
+            """Select `(id, data)` rows, where `data` is the cached serialized
+            service or None if there's no current cached copy.
+            """
+            return self.outerjoin(
+                SerializedService, and_(
+                    SerializedService.id == Service.id,
+                    SerializedService.updated_at == Service.updated_at
+                )
+            ).with_entities(Service.id, SerializedService.data)
+
+        def with_fields(self, *fields):
+            """Select `(id, value, ...)` rows with a value for each of the
+            serialized service keys in `fields`.
+            """
+            return self.join(
+                Service.supplier, Service.framework, Service.lot
+            ).with_entities(Service.id, *[Service.field_column(field) for field in fields])
+
+    @staticmethod
+    def field_column(field):
+        """Return the column a serialized service key is read from
+
+        Keys that aren't added by `serialize` are read from the `data` column.
+        """
+        columns = {
+            'id': Service.service_id,
+            'supplierId': Service.supplier_id,
+            'supplierName': Supplier.name,
+            'frameworkSlug': Framework.slug,
+            'frameworkName': Framework.name,
+            'frameworkStatus': Framework.status,
+            'lot': Lot.slug,
+            'lotName': Lot.name,
+            'updatedAt': Service.updated_at,
+            'createdAt': Service.created_at,
+            'status': Service.status,
+        }
+
+        if field in columns:
+            return columns[field]
+        return Service.data[field]
+
+    @staticmethod
+    def link_object(service_id):
+        return url_for(".get_service", service_id=service_id)
+
     def get_link(self):
-        return url_for(".get_service", service_id=self.service_id)
+        return self.link_object(self.service_id)
+
+
+class SerializedService(db.Model):
+    """Cached output of `Service.serialize()`, without the links
+
+    Links depend on the request host, so they're added when the cached
+    copy is read. A cached copy is only used while its `updated_at` matches
+    the service's.
+    """
+    __tablename__ = 'serialized_services'
+
+    id = db.Column(db.Integer, db.ForeignKey('services.id', ondelete='CASCADE'), primary_key=True)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    data = db.Column(JSON, nullable=False)
+
+    @staticmethod
+    def from_service(service):
+        data = service.serialize()
+        data.pop('links')
+
+        return SerializedService(
+            id=service.id,
+            updated_at=service.updated_at,
+            data=data
+        )
+
+    @staticmethod
+    def invalidate(*criteria):
+        """Remove the cached copies of all services matching the criteria
+
+        Used when a change to a related supplier or framework changes the
+        serialized services without changing the services themselves.
+        """
+        services = db.session.query(Service.id).filter(*criteria).subquery()
+
+        return SerializedService.query.filter(
+            SerializedService.id.in_(services)
+        ).delete(synchronize_session=False)
+
+    @staticmethod
+    def add_links(data):
+        return dict(data, links=link(
+            "self", Service.link_object(data['id'])
+        ))
+
+
+class SearchIndexUpdate(db.Model):
+    """A pending change to a service's search index document
+
+    Written in the same transaction as the change to the service and sent
+    to the search API later by the `process_search_index_updates` worker,
+    so a slow or unavailable search API doesn't hold up the request.
+    """
+    __tablename__ = 'search_index_updates'
+
+    ACTIONS = ['index', 'delete']
+
+    id = db.Column(db.Integer, primary_key=True)
+    service_id = db.Column(db.String, index=True, nullable=False)
+    action = db.Column(db.String, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.String, nullable=True)
+
+    @validates('action')
+    def validates_action(self, key, value):
+        if value not in self.ACTIONS:
+            raise ValidationError("Invalid search index action '{}'".format(value))
+
+        return value
 
 
 class ArchivedService(db.Model, ServiceTableMixin):
@@ -650,9 +881,9 @@ class AuditEvent(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     type = db.Column(db.String, index=True, nullable=False)
-    created_at = db.Column(db.DateTime, index=True, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, index=False, nullable=False, default=datetime.utcnow)
     user = db.Column(db.String)
-    data = db.Column(JSON)
+    data = db.Column(JSONB)
 
     object_type = db.Column(db.String)
     object_id = db.Column(db.BigInteger)
@@ -679,8 +910,10 @@ class AuditEvent(db.Model):
         self.user = user
         self.acknowledged = False
 
-    def serialize(self, include_user=False):
+    def serialize(self, user_names=None):
         """
+        :param user_names: optional dict of email address to user name, to
+                           add the name of the event's user
         :return: dictionary representation of an audit event
         """
 
@@ -710,18 +943,127 @@ class AuditEvent(db.Model):
                     self.acknowledged_by,
             })
 
-        if include_user:
-            user = User.query.filter(
-                User.email_address == self.user
-            ).first()
-
-            if user:
-                data['userName'] = user.name
+        if user_names is not None and user_names.get(self.user):
+            data['userName'] = user_names[self.user]
 
         return data
 
 
+def update_supplier_live_frameworks(session, supplier_framework_ids):
+    """Add or remove the `SupplierLiveFramework` rows for the given
+    `(supplier_id, framework_id)` pairs to match their published services
+
+    The suppliers must be locked with `lock_suppliers` first.
+    """
+    table = SupplierLiveFramework.__table__
+    for supplier_id, framework_id in sorted(set(supplier_framework_ids)):
+        session.execute(table.delete().where(and_(
+            table.c.supplier_id == supplier_id,
+            table.c.framework_id == framework_id
+        )))
+        session.execute(table.insert().from_select(
+            ['supplier_id', 'framework_id'],
+            select([literal(supplier_id), literal(framework_id)]).where(exists().where(and_(
+                Service.supplier_id == supplier_id,
+                Service.framework_id == framework_id,
+                Service.status == 'published'
+            )))
+        ))
+
+
+def service_counts_select(model, kind):
+    """Select the `ServiceCount` rows of the given kind from the services or
+    draft services table
+    """
+    return select([
+        model.supplier_id, model.framework_id, model.lot_id, model.status, literal(kind), func.count()
+    ]).group_by(model.supplier_id, model.framework_id, model.lot_id, model.status)
+
+
+def update_service_counts(session, supplier_framework_ids):
+    """Recount the `ServiceCount` rows for the given `(supplier_id,
+    framework_id)` pairs from their services and drafts
+
+    The suppliers must be locked with `lock_suppliers` first.
+    """
+    table = ServiceCount.__table__
+    for supplier_id, framework_id in sorted(set(supplier_framework_ids)):
+        session.execute(table.delete().where(and_(
+            table.c.supplier_id == supplier_id,
+            table.c.framework_id == framework_id
+        )))
+        for model, kind in [(Service, 'service'), (DraftService, 'draft')]:
+            session.execute(table.insert().from_select(
+                ['supplier_id', 'framework_id', 'lot_id', 'status', 'kind', 'count'],
+                service_counts_select(model, kind).where(and_(
+                    model.supplier_id == supplier_id,
+                    model.framework_id == framework_id
+                ))
+            ))
+
+
+def lock_suppliers(session, supplier_ids):
+    """Lock the rows of the given suppliers, in supplier_id order
+
+    Taken before a supplier's summary rows are deleted and recalculated, so
+    concurrent updates to the same supplier's services can't both insert
+    the same rows.
+    """
+    supplier_ids = sorted(set(supplier_ids))
+    if supplier_ids:
+        session.execute(
+            select([Supplier.id]).where(
+                Supplier.supplier_id.in_(supplier_ids)
+            ).order_by(Supplier.supplier_id).with_for_update()
+        )
+
+
+def _flushed_supplier_framework_ids(session):
+    """Return the `(supplier_id, framework_id)` pairs whose summary rows
+    may be changed by the flush, as a set for services and one for drafts
+
+    A service or draft counts if it was added or deleted, or if its
+    supplier, framework, lot or status changed. When it moved to another
+    supplier or framework, the pair it moved from is included as well.
+    """
+    changed = dict((model, set()) for model in (Service, DraftService))
+    for service in list(session.new) + list(session.dirty) + list(session.deleted):
+        model = type(service)
+        if model not in changed:
+            continue
+
+        attrs = inspect(service).attrs
+        if service in session.new or service in session.deleted or any(
+            attrs[name].history.has_changes() for name in ['supplier_id', 'framework_id', 'lot_id', 'status']
+        ):
+            changed[model].add((service.supplier_id, service.framework_id))
+            changed[model].add((
+                _value_before_flush(attrs.supplier_id),
+                _value_before_flush(attrs.framework_id),
+            ))
+
+    return changed[Service], changed[DraftService]
+
+
+def _value_before_flush(attr):
+    return attr.history.deleted[0] if attr.history.deleted else attr.value
+
+
+@event.listens_for(Session, 'after_flush')
+def update_supplier_summaries_after_flush(session, flush_context):
+    """Update the `SupplierLiveFramework` and `ServiceCount` rows for the
+    services and drafts in the flush, locking each affected supplier once
+    """
+    service_ids, draft_ids = _flushed_supplier_framework_ids(session)
+    if service_ids or draft_ids:
+        lock_suppliers(session, [supplier_id for supplier_id, _ in service_ids | draft_ids])
+        update_supplier_live_frameworks(session, service_ids)
+        update_service_counts(session, service_ids | draft_ids)
+
+
+db.Index('ix_suppliers_name_initial', Supplier.name_initial, Supplier.name, Supplier.supplier_id)
 db.Index('idx_audit_events_object', AuditEvent.object_type, AuditEvent.object_id)
+db.Index('ix_audit_events_created_at_id', AuditEvent.created_at, AuditEvent.id)
 
 
 def filter_null_value_fields(obj):
@@ -1,12 +1,19 @@
+from datetime import datetime, timedelta
+
 from flask import current_app, abort
+from dmutils.formats import DATETIME_FORMAT
+from sqlalchemy import and_, false, func, inspect, or_, union_all
 from sqlalchemy.exc import IntegrityError, DataError
 
 from .utils import get_json_from_request, \
-    json_has_matching_id, json_has_required_keys
-from .validation import validate_updater_json_or_400, get_validation_errors
+    json_has_matching_id, json_has_required_keys, link
+from .validation import validate_updater_json_or_400, get_validation_errors, is_valid_service_id
 from . import search_api_client, apiclient
 from . import db
-from .models import ArchivedService, AuditEvent, Framework, Service, Supplier
+from .framework_utils import get_framework_registry
+from .models import ArchivedService, AuditEvent, DraftService, Service, ServiceCount, Supplier, \
+    SerializedService, SearchIndexUpdate, ValidationError, service_counts_select, update_service_counts, \
+    update_supplier_live_frameworks, lock_suppliers
 
 
 def validate_and_return_updater_request():
@@ -26,9 +33,7 @@ def validate_and_return_service_request(service_id):
 def validate_and_return_related_objects(service_json):
     json_has_required_keys(service_json, ['frameworkSlug', 'lot', 'supplierId'])
 
-    framework = Framework.query.filter(
-        Framework.slug == service_json['frameworkSlug']
-    ).first()
+    framework = get_framework_registry().get_by_slug(service_json['frameworkSlug'])
 
     if not framework:
         abort(400, "Framework '{}' does not exits".format(service_json['frameworkSlug']))
@@ -51,6 +56,93 @@ def validate_and_return_related_objects(service_json):
     return framework, lot, supplier
 
 
+def get_related_objects_for_services(services_json):
+    """Load the frameworks and suppliers referenced by a list of services
+
+    :return: a dict of frameworks by slug and a dict of suppliers by
+             supplier id string
+    """
+    framework_slugs = set(service.get('frameworkSlug') for service in services_json)
+    supplier_ids = set(
+        int(service['supplierId']) for service in services_json
+        if str(service.get('supplierId')).isdigit()
+    )
+
+    registry = get_framework_registry()
+    frameworks = [registry.get_by_slug(slug) for slug in framework_slugs]
+    suppliers = Supplier.query.filter(Supplier.supplier_id.in_(supplier_ids)).all() if supplier_ids else []
+
+    return (
+        {framework.slug: framework for framework in frameworks if framework is not None},
+        {str(supplier.supplier_id): supplier for supplier in suppliers},
+    )
+
+
+# Imported services have timestamps from the legacy app, without microseconds
+IMPORT_DATETIME_FORMATS = (DATETIME_FORMAT, '%Y-%m-%dT%H:%M:%SZ')
+
+
+def parse_import_datetime(service_json, key):
+    """Parse an optional timestamp from one item of a bulk import
+
+    :raises ValidationError: if the timestamp isn't in a format we accept
+    """
+    value = service_json.get(key)
+    if value is None:
+        return None
+
+    for datetime_format in IMPORT_DATETIME_FORMATS:
+        try:
+            return datetime.strptime(value, datetime_format)
+        except (TypeError, ValueError):
+            pass
+
+    raise ValidationError("Invalid {} '{}'".format(key, value))
+
+
+def service_from_import_json(service_json, frameworks, suppliers):
+    """Build a validated, unsaved Service from one item of a bulk import
+
+    :raises ValidationError: if the service can't be imported
+    """
+    missing_keys = set(['id', 'frameworkSlug', 'lot', 'supplierId']) - set(service_json.keys())
+    if missing_keys:
+        raise ValidationError("Invalid JSON must have '{}' keys".format(sorted(missing_keys)))
+
+    service_id = str(service_json['id'])
+    if not is_valid_service_id(service_id):
+        raise ValidationError("Invalid service ID supplied: {}".format(service_id))
+
+    framework = frameworks.get(service_json['frameworkSlug'])
+    if not framework:
+        raise ValidationError("Framework '{}' does not exist".format(service_json['frameworkSlug']))
+
+    lot = framework.get_lot(service_json['lot'])
+    if not lot:
+        raise ValidationError("Incorrect lot '{}' for framework '{}'".format(service_json['lot'], framework.slug))
+
+    supplier = suppliers.get(str(service_json['supplierId']))
+    if not supplier:
+        raise ValidationError("Invalid supplier_id '{}'".format(service_json['supplierId']))
+
+    service = Service(
+        service_id=service_id,
+        supplier=supplier,
+        lot=lot,
+        framework=framework,
+        status=service_json.get('status', 'published'),
+        created_at=parse_import_datetime(service_json, 'createdAt'),
+        updated_at=parse_import_datetime(service_json, 'updatedAt'),
+        data=service_json,
+    )
+
+    errs = get_service_validation_errors(service)
+    if errs:
+        raise ValidationError(errs)
+
+    return service
+
+
 def update_and_validate_service(service, service_payload):
     service.update_from_json(service_payload)
     validate_service_data(service)
@@ -82,13 +174,17 @@ def get_service_validation_errors(service, enforce_required=True, required_field
 
 def commit_and_archive_service(updated_service, update_details,
                                audit_type, audit_data=None):
-    service_to_archive = ArchivedService.from_service(updated_service)
+    # Every UPDATE that doesn't set `updated_at` gets a new one from
+    # `onupdate`, so stamp it here to keep the archived copy in step
+    if not inspect(updated_service).attrs.updated_at.history.has_changes():
+        updated_service.updated_at = datetime.utcnow()
 
-    last_archive = ArchivedService.query.filter(
-        ArchivedService.service_id == updated_service.service_id
-    ).order_by(ArchivedService.id.desc()).first()
+    service_to_archive = ArchivedService.from_service(updated_service)
+    last_archive = updated_service.latest_archived_service_id
 
-    last_archive = last_archive.id if last_archive else None
+    # The flush inserts the archived copy first, then writes the service
+    # once, with its id
+    updated_service.latest_archived_service = service_to_archive
 
     if audit_data is None:
         audit_data = {}
@@ -115,29 +211,219 @@ def commit_and_archive_service(updated_service, update_details,
         )
 
         db.session.add(audit)
+
+        # Imported services can have their timestamps set from strings, so
+        # reload them from the database before serializing
+        db.session.expire(updated_service, ['created_at', 'updated_at'])
+        db.session.merge(SerializedService.from_service(updated_service))
         db.session.commit()
     except IntegrityError as e:
         db.session.rollback()
         abort(400, e.orig)
 
 
+def commit_and_archive_services(new_services, update_details, audit_type):
+    """Insert new services together with their archived copies and audit events
+
+    Each table gets a single multi-row INSERT instead of one INSERT per
+    service. The services must not be in the database yet.
+
+    :return: the inserted services, loaded from the database
+    """
+    now = datetime.utcnow()
+    service_rows = [{
+        'service_id': service.service_id,
+        'supplier_id': service.supplier.supplier_id,
+        'framework_id': service.framework.id,
+        'lot_id': service.lot.id,
+        'status': service.status,
+        'data': service.data,
+        'created_at': service.created_at or now,
+        'updated_at': service.updated_at or now,
+    } for service in new_services]
+
+    def insert_returning_ids(model, rows):
+        table = model.__table__
+        return dict(db.session.execute(
+            table.insert().values(rows).returning(table.c.service_id, table.c.id)
+        ).fetchall())
+
+    try:
+        archived_service_ids = insert_returning_ids(ArchivedService, service_rows)
+        service_ids = insert_returning_ids(Service, [
+            dict(row, latest_archived_service_id=archived_service_ids[row['service_id']])
+            for row in service_rows
+        ])
+
+        supplier_framework_ids = [(row['supplier_id'], row['framework_id']) for row in service_rows]
+        lock_suppliers(db.session, [row['supplier_id'] for row in service_rows])
+        update_supplier_live_frameworks(db.session, supplier_framework_ids)
+        update_service_counts(db.session, supplier_framework_ids)
+
+        db.session.execute(AuditEvent.__table__.insert().values([{
+            'type': audit_type.value,
+            'created_at': now,
+            'user': update_details['updated_by'],
+            'data': {
+                'supplierName': service.supplier.name,
+                'supplierId': service.supplier.supplier_id,
+                'serviceId': service.service_id,
+                'oldArchivedServiceId': None,
+                'newArchivedServiceId': archived_service_ids[service.service_id],
+            },
+            'object_type': Service.__name__,
+            'object_id': service_ids[service.service_id],
+            'acknowledged': False,
+        } for service in new_services]))
+
+        services = Service.query.filter(
+            Service.id.in_(list(service_ids.values()))
+        ).order_by(Service.id).all()
+        db.session.add_all([SerializedService.from_service(service) for service in services])
+
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        abort(400, e.orig)
+
+    return services
+
+
+def serialize_services(rows):
+    """Serialize `(id, data)` rows returned by `Service.query.with_serialized_data()`
+
+    Cached copies are used where they're current. The remaining services
+    are loaded with a single query and serialized from the ORM objects.
+    """
+    missing_ids = [row.id for row in rows if row.data is None]
+    services = {}
+    if missing_ids:
+        services = {
+            service.id: service
+            for service in Service.query.filter(Service.id.in_(missing_ids))
+        }
+
+    return [
+        SerializedService.add_links(row.data) if row.data is not None else services[row.id].serialize()
+        for row in rows
+    ]
+
+
+def serialize_service_fields(rows, fields):
+    """Build partial services from `Service.query.with_fields(*fields)` rows
+
+    Keys without a value are left out, as `serialize` does for the
+    service data.
+    """
+    services = []
+    for row in rows:
+        service = {}
+        for field, value in zip(fields, row[1:]):
+            if isinstance(value, datetime):
+                value = value.strftime(DATETIME_FORMAT)
+            if value is not None:
+                service[field] = value
+        service['links'] = link("self", Service.link_object(service['id']))
+        services.append(service)
+
+    return services
+
+
 def index_service(service):
+    """Queue the service to be added to the search index if it's live
+
+    Call before the change to the service is committed so the queued update
+    is saved in the same transaction.
+    """
     if service.framework.status == 'live' and service.status == 'published':
+        db.session.add(SearchIndexUpdate(service_id=service.service_id, action='index'))
+
+
+def delete_service_from_index(service):
+    """Queue the service to be removed from the search index
+
+    Call before the change to the service is committed so the queued update
+    is saved in the same transaction.
+    """
+    db.session.add(SearchIndexUpdate(service_id=service.service_id, action='delete'))
+
+
+def send_search_index_updates(batch_size):
+    """Send a batch of queued search index updates to the search API
+
+    Only the latest update for each service is sent, earlier ones are
+    superseded and removed. Failed updates are retried with a doubling delay
+    until DM_SEARCH_INDEX_MAX_ATTEMPTS is reached, after which they're kept
+    with their last error for inspection.
+
+    Needs a request context to build the links in the indexed services.
+
+    :return: the number of updates sent or attempted
+    """
+    now = datetime.utcnow()
+    max_attempts = current_app.config['DM_SEARCH_INDEX_MAX_ATTEMPTS']
+    retry_delay = current_app.config['DM_SEARCH_INDEX_RETRY_DELAY']
+
+    latest_update_ids = db.session.query(
+        func.max(SearchIndexUpdate.id)
+    ).group_by(SearchIndexUpdate.service_id)
+
+    updates = SearchIndexUpdate.query.filter(
+        SearchIndexUpdate.id.in_(latest_update_ids.subquery()),
+        SearchIndexUpdate.attempts < max_attempts,
+        or_(SearchIndexUpdate.next_attempt_at.is_(None), SearchIndexUpdate.next_attempt_at <= now)
+    ).order_by(SearchIndexUpdate.id).limit(batch_size).all()
+
+    if not updates:
+        return 0
+
+    service_ids_to_index = [update.service_id for update in updates if update.action == 'index']
+    services = {}
+    if service_ids_to_index:
+        services = {
+            service.service_id: service
+            for service in Service.query.filter(Service.service_id.in_(service_ids_to_index))
+        }
+
+    sent_update_ids = []
+    for update in updates:
         try:
-            search_api_client.index(service.service_id, service.serialize())
+            if update.action == 'index':
+                _send_service_to_index(services.get(update.service_id))
+            else:
+                _send_service_deletion_to_index(update.service_id)
+            sent_update_ids.append(update.id)
         except apiclient.HTTPError as e:
+            update.attempts += 1
+            update.last_error = u'{}'.format(e.message)
+            update.next_attempt_at = now + timedelta(seconds=retry_delay * 2 ** (update.attempts - 1))
             current_app.logger.warning(
-                'Failed to add {} to search index: {}'.format(
-                    service.service_id, e.message))
+                'Failed to {} {} in search index (attempt {}): {}'.format(
+                    update.action, update.service_id, update.attempts, e.message))
 
+    SearchIndexUpdate.query.filter(or_(
+        SearchIndexUpdate.id.in_(sent_update_ids) if sent_update_ids else false(),
+        *[and_(SearchIndexUpdate.service_id == update.service_id, SearchIndexUpdate.id < update.id)
+          for update in updates]
+    )).delete(synchronize_session=False)
+    db.session.commit()
 
-def delete_service_from_index(service):
+    return len(updates)
+
+
+def _send_service_to_index(service):
+    # The service may have been unpublished after the update was queued,
+    # in which case there'll be a later update to delete it
+    if service is not None and service.framework.status == 'live' and service.status == 'published':
+        search_api_client.index(service.service_id, service.serialize())
+
+
+def _send_service_deletion_to_index(service_id):
     try:
-        search_api_client.delete(service.service_id)
+        search_api_client.delete(service_id)
     except apiclient.HTTPError as e:
-        current_app.logger.warning(
-            'Failed to remove {} to search index: {}'.format(
-                service.service_id, e.message))
+        if e.status_code != 404:
+            raise
 
 
 def create_service_from_draft(draft, status):
@@ -157,3 +443,36 @@ def create_service_from_draft(draft, status):
             db.session.rollback()
             if counter >= 5:
                 raise
+
+
+def check_service_counts(fix=False):
+    """Compare the `ServiceCount` table with the services and drafts tables
+
+    Returns a sorted list of `((supplier_id, framework_id, lot_id, status,
+    kind), stored_count, actual_count)` for the counts that are wrong. With
+    `fix` the counts for each affected supplier and framework are
+    recalculated and committed.
+    """
+    actual = dict(
+        (tuple(row[:5]), row[5]) for row in db.session.execute(union_all(
+            service_counts_select(Service, 'service'),
+            service_counts_select(DraftService, 'draft')
+        ))
+    )
+    stored = dict(
+        ((row.supplier_id, row.framework_id, row.lot_id, row.status, row.kind), row.count)
+        for row in ServiceCount.query
+    )
+
+    differences = sorted(
+        (key, stored.get(key, 0), actual.get(key, 0))
+        for key in set(stored) | set(actual)
+        if stored.get(key, 0) != actual.get(key, 0)
+    )
+
+    if fix and differences:
+        lock_suppliers(db.session, [key[0] for key, _, _ in differences])
+        update_service_counts(db.session, [key[:2] for key, _, _ in differences])
+        db.session.commit()
+
+    return differences
@@ -1,4 +1,7 @@
+from flask import current_app
+
 from .. import db
+from ..database import get_pool_status, REPLICA_BIND
 
 
 def get_db_version():
@@ -6,3 +9,13 @@ def get_db_version():
     return db.engine.execute(
         "SELECT version_num FROM alembic_version"
     ).scalar()
+
+
+def get_db_pool_status():
+    return get_pool_status(db.engine)
+
+
+def get_db_replica_pool_status():
+    if REPLICA_BIND not in (current_app.config['SQLALCHEMY_BINDS'] or {}):
+        return None
+    return get_pool_status(db.get_engine(current_app, bind=REPLICA_BIND))
@@ -22,6 +22,8 @@ def status_no_db():
             status="ok",
             version=version,
             db_version=utils.get_db_version(),
+            db_pool=utils.get_db_pool_status(),
+            db_replica_pool=utils.get_db_replica_pool_status(),
             flags=get_flags(current_app)
         )
 
@@ -31,5 +33,7 @@ def status_no_db():
             status="error",
             version=version,
             message="Error connecting to database",
+            db_pool=utils.get_db_pool_status(),
+            db_replica_pool=utils.get_db_replica_pool_status(),
             flags=get_flags(current_app)
         ), 500
@@ -1,5 +1,6 @@
 from .validation import validate_supplier_json_or_400, validate_new_supplier_json_or_400
-from .utils import get_json_from_request, json_has_matching_id, json_has_required_keys, drop_foreign_fields
+from .utils import get_json_from_request, json_has_matching_id, json_has_required_keys, drop_foreign_fields, \
+    link, url_for
 
 
 def validate_and_return_supplier_request(supplier_id=None):
@@ -21,3 +22,14 @@ def validate_and_return_supplier_request(supplier_id=None):
         validate_new_supplier_json_or_400(json_payload['suppliers'])
 
     return json_payload['suppliers']
+
+
+def serialize_supplier_fields(rows, fields):
+    """Build partial suppliers from rows with a value for each key in `fields`"""
+    suppliers = []
+    for row in rows:
+        supplier = dict((field, value) for field, value in zip(fields, row) if value is not None)
+        supplier['links'] = link("self", url_for(".get_supplier", supplier_id=supplier['id']))
+        suppliers.append(supplier)
+
+    return suppliers
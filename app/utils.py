@@ -1,5 +1,10 @@
+import re
+import zlib
+from functools import wraps
+
 from flask import url_for as base_url_for
-from flask import abort, request
+from flask import abort, current_app, request, make_response
+from flask.ext.sqlalchemy import get_debug_queries
 from six import iteritems, string_types
 from werkzeug.exceptions import BadRequest
 
@@ -15,6 +20,89 @@ def url_for(*args, **kwargs):
     return base_url_for(*args, **kwargs)
 
 
+def with_etag(view):
+    """Add a strong ETag to a view's successful responses
+
+    The ETag is a hash of the response body. Requests with a matching
+    `If-None-Match` header get a 304 response without a body. Tags are
+    compared weakly since compressed responses carry a weak ETag.
+    """
+    @wraps(view)
+    def decorated_view(*args, **kwargs):
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            response.add_etag()
+            if request.if_none_match.contains_weak(response.get_etag()[0]):
+                response.status_code = 304
+        return response
+
+    return decorated_view
+
+
+def compress_response(response):
+    """Compress the response body if the client accepts gzip or deflate
+
+    Only complete, successful responses of at least
+    DM_API_COMPRESSION_MIN_SIZE bytes are compressed, at
+    DM_API_COMPRESSION_LEVEL. A strong ETag is made weak, as the compressed
+    body isn't byte-for-byte the same representation.
+    """
+    if response.status_code != 200 or response.direct_passthrough or response.is_streamed \
+            or 'Content-Encoding' in response.headers:
+        return response
+
+    data = response.get_data()
+    if len(data) < current_app.config['DM_API_COMPRESSION_MIN_SIZE']:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(['gzip', 'deflate'])
+    if encoding is None:
+        return response
+
+    # wbits with 16 added writes a gzip header and trailer instead of zlib's
+    wbits = zlib.MAX_WBITS | 16 if encoding == 'gzip' else zlib.MAX_WBITS
+    compressor = zlib.compressobj(current_app.config['DM_API_COMPRESSION_LEVEL'], zlib.DEFLATED, wbits)
+    response.set_data(compressor.compress(data) + compressor.flush())
+    response.headers['Content-Encoding'] = encoding
+
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+    return response
+
+
+def log_db_queries(response):
+    """Log the number of database queries made for the request, the total
+    time spent on them and the slowest statement
+
+    With DM_DB_QUERY_HEADERS the count and time are also sent in the
+    X-DB-Queries and X-DB-Time headers. Queries made while a streamed
+    response is sent aren't included.
+    """
+    queries = get_debug_queries()
+    db_time = sum(query.duration for query in queries)
+    slowest = max(queries, key=lambda query: query.duration) if queries else None
+
+    current_app.logger.info(
+        '{} {}: {} database queries in {:.3f}s'.format(request.method, request.path, len(queries), db_time),
+        extra={
+            'request_id': request.headers.get(current_app.config['DM_REQUEST_ID_HEADER']),
+            'db_queries': len(queries),
+            'db_time': db_time,
+            'db_slowest_statement': slowest.statement if slowest else None,
+            'db_slowest_time': slowest.duration if slowest else None,
+        }
+    )
+
+    if current_app.config['DM_DB_QUERY_HEADERS']:
+        response.headers['X-DB-Queries'] = str(len(queries))
+        response.headers['X-DB-Time'] = '{:.6f}'.format(db_time)
+
+    return response
+
+
 def get_valid_page_or_1():
     try:
         return int(request.args.get('page', 1))
@@ -22,13 +110,65 @@ def get_valid_page_or_1():
         abort(400, "Invalid page argument")
 
 
+def get_valid_fields_or_none():
+    """Return the keys listed in the comma separated `fields` argument
+
+    'id' is always included, first, so the results can be linked.
+    """
+    fields = request.args.get('fields')
+    if fields is None:
+        return None
+
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    if not fields or not all(re.match(r'^[A-Za-z0-9_]+$', field) for field in fields):
+        abort(400, "Invalid fields argument")
+
+    return ['id'] + sorted(set(fields) - set(['id']), key=fields.index)
+
+
+def get_valid_after_id_or_none():
+    after_id = request.args.get('after_id')
+    if after_id is None:
+        return None
+    try:
+        return int(after_id)
+    except ValueError:
+        abort(400, "Invalid after_id argument")
+
+
 def pagination_links(pagination, endpoint, args):
     links = dict()
     if pagination.has_prev:
-        links['prev'] = url_for(endpoint, **dict(list(args.items()) + [('page', pagination.prev_num)]))
+        links['prev'] = url_for(endpoint, **dict(args.lists(), page=pagination.prev_num))
     if pagination.has_next:
-        links['next'] = url_for(endpoint, **dict(list(args.items()) + [('page', pagination.next_num)]))
-        links['last'] = url_for(endpoint, **dict(list(args.items()) + [('page', pagination.pages)]))
+        links['next'] = url_for(endpoint, **dict(args.lists(), page=pagination.next_num))
+        links['last'] = url_for(endpoint, **dict(args.lists(), page=pagination.pages))
+    return links
+
+
+def page_links(page, has_next, endpoint, args):
+    """Generate links for a page fetched without counting the items.
+
+    Without a count there's no ``last`` link, only ``prev`` and ``next``.
+    """
+    links = dict()
+    if page > 1:
+        links['prev'] = url_for(endpoint, **dict(args.lists(), page=page - 1))
+    if has_next:
+        links['next'] = url_for(endpoint, **dict(args.lists(), page=page + 1))
+    return links
+
+
+def keyset_pagination_links(next_after_id, endpoint, args):
+    """Generate links for a page fetched with an ``after_id`` cursor.
+
+    Keyset pages don't know their position in the full result set, so
+    only a ``next`` link is generated, and only if there are more items.
+    """
+    links = dict()
+    if next_after_id is not None:
+        args = [(key, values) for key, values in args.lists() if key not in ['page', 'after_id']]
+        links['next'] = url_for(endpoint, **dict(args, after_id=next_after_id))
     return links
 
 
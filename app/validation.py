@@ -2,6 +2,8 @@ import json
 import re
 import os
 import copy
+import threading
+from collections import OrderedDict
 from decimal import Decimal
 
 from flask import abort
@@ -55,18 +57,105 @@ def load_schemas(schemas_path, schema_names):
 _SCHEMAS = load_schemas(JSON_SCHEMAS_PATH, SCHEMA_NAMES)
 
 
+class ValidatorCache(object):
+    """Least recently used cache of validator instances, kept per thread
+
+    A validator's `RefResolver` keeps a stack of resolution scopes that
+    changes while it follows `$ref`s, so an instance mustn't be shared by
+    threads validating at the same time. Each thread has its own cache and
+    builds its own instances, without waiting for any other thread.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._local = threading.local()
+
+    @property
+    def _validators(self):
+        if not hasattr(self._local, 'validators'):
+            self._local.validators = OrderedDict()
+        return self._local.validators
+
+    def get(self, key, build_validator):
+        validators = self._validators
+        validator = validators.pop(key, None)
+        if validator is None:
+            validator = build_validator()
+        validators[key] = validator
+        if len(validators) > self.maxsize:
+            validators.popitem(last=False)
+        return validator
+
+    def clear(self):
+        self._validators.clear()
+
+    def __len__(self):
+        return len(self._validators)
+
+
+class SchemaCache(object):
+    """Least recently used cache of schemas, shared by all threads
+
+    Building the schema for a set of required fields means deep-copying the
+    whole schema, which is slow for the larger service schemas. Schemas are
+    built without holding the lock, so a miss doesn't hold up other threads;
+    if two threads build the same schema the first one stored is kept.
+    Schemas aren't changed once they're built.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._schemas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build_schema):
+        with self._lock:
+            schema = self._schemas.pop(key, None)
+            if schema is not None:
+                self._schemas[key] = schema
+                return schema
+
+        schema = build_schema()
+
+        with self._lock:
+            schema = self._schemas.setdefault(key, schema)
+            if len(self._schemas) > self.maxsize:
+                self._schemas.popitem(last=False)
+            return schema
+
+    def clear(self):
+        with self._lock:
+            self._schemas.clear()
+
+
+_VALIDATORS = ValidatorCache(maxsize=256)
+_PARTIAL_SCHEMAS = SchemaCache(maxsize=256)
+
+
 def get_validator(schema_name, enforce_required=True, required_fields=None):
-    if required_fields is None:
-        required_fields = []
-    if enforce_required:
-        schema = _SCHEMAS[schema_name]
-    else:
-        schema = copy.deepcopy(_SCHEMAS[schema_name])
-        schema['required'] = [
-            field for field in schema.get('required', [])
-            if field in required_fields
-        ]
-        schema.pop('anyOf', None)
+    # required_fields only changes the schema if enforce_required is False
+    required_fields_key = frozenset() if enforce_required else frozenset(required_fields or [])
+    key = (schema_name, enforce_required, required_fields_key)
+
+    def build_cached_validator():
+        if enforce_required:
+            schema = _SCHEMAS[schema_name]
+        else:
+            schema = _PARTIAL_SCHEMAS.get(key, lambda: build_partial_schema(schema_name, required_fields))
+        return build_validator(schema)
+
+    return _VALIDATORS.get(key, build_cached_validator)
+
+
+def build_partial_schema(schema_name, required_fields=None):
+    schema = copy.deepcopy(_SCHEMAS[schema_name])
+    schema['required'] = [
+        field for field in schema.get('required', [])
+        if field in (required_fields or [])
+    ]
+    schema.pop('anyOf', None)
+    return schema
+
+
+def build_validator(schema):
     return validator_for(schema)(schema, format_checker=FORMAT_CHECKER)
 
 
@@ -3,6 +3,8 @@
 from __future__ import print_function
 
 import os
+import sys
+import time
 
 from dmutils import init_manager
 from flask.ext.migrate import Migrate, MigrateCommand
@@ -17,5 +19,93 @@ migrate = Migrate(application, db)
 manager.add_command('db', MigrateCommand)
 
 
+@manager.command
+def rebuild_serialized_services():
+    """Rebuild the cached serialized copy of every service"""
+    from sqlalchemy import orm
+    from app.models import Framework, Service, SerializedService, Supplier
+
+    with application.test_request_context():
+        SerializedService.query.delete()
+
+        services = Service.query.options(
+            orm.defaultload(Service.framework).lazyload(Framework.lots),
+            orm.defaultload(Service.supplier).lazyload(Supplier.contact_information),
+        ).yield_per(500)
+
+        for count, service in enumerate(services, 1):
+            db.session.add(SerializedService.from_service(service))
+            if count % 500 == 0:
+                db.session.flush()
+
+        db.session.commit()
+        print("Rebuilt {} serialized services".format(SerializedService.query.count()))
+
+
+@manager.command
+def process_search_index_updates(once=False):
+    """Send queued service changes to the search API
+
+    Polls for new updates until stopped, or exits once the queue is empty
+    when run with --once.
+    """
+    from app.service_utils import send_search_index_updates
+
+    batch_size = application.config['DM_SEARCH_INDEX_BATCH_SIZE']
+    while True:
+        with application.test_request_context():
+            sent = send_search_index_updates(batch_size)
+
+        if sent < batch_size:
+            if once:
+                break
+            time.sleep(application.config['DM_SEARCH_INDEX_POLL_INTERVAL'])
+
+
+@manager.command
+def check_service_counts(fix=False):
+    """Check the service counts table against the services and drafts
+
+    Prints each count that doesn't match and exits with an error, or
+    recalculates the wrong counts when run with --fix.
+    """
+    from app.service_utils import check_service_counts as find_wrong_service_counts
+
+    with application.test_request_context():
+        differences = find_wrong_service_counts(fix=fix)
+
+    for (supplier_id, framework_id, lot_id, status, kind), stored, actual in differences:
+        print("supplier {} framework {} lot {} {} {}: stored {}, actual {}".format(
+            supplier_id, framework_id, lot_id, status, kind, stored, actual))
+
+    if not differences:
+        print("Service counts are correct")
+    elif fix:
+        print("Fixed {} service counts".format(len(differences)))
+    else:
+        sys.exit("{} service counts are wrong, run with --fix to recalculate them".format(len(differences)))
+
+
+@manager.command
+def refresh_framework_stats(once=False):
+    """Recalculate the stats for open and pending frameworks, and for
+    frameworks that have no stats yet
+
+    Keeps the stats served with DM_FRAMEWORK_STATS_REFRESH='background' up to
+    date. Refreshes every DM_FRAMEWORK_STATS_REFRESH_INTERVAL seconds until
+    stopped, or exits after one refresh when run with --once.
+    """
+    from app.framework_utils import refresh_framework_stats as refresh
+
+    while True:
+        with application.test_request_context():
+            slugs = refresh()
+        print("Refreshed stats for {}".format(", ".join(slugs) or "no frameworks"))
+
+        if once:
+            break
+        time.sleep(application.config['DM_FRAMEWORK_STATS_REFRESH_INTERVAL'])
+
+
 if __name__ == '__main__':
     manager.run()
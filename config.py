@@ -26,10 +26,51 @@ class Config:
     FEATURE_FLAGS_TRANSACTION_ISOLATION = False
 
     DM_API_SERVICES_PAGE_SIZE = 100
+    DM_API_SERVICES_EXPORT_BATCH_SIZE = 500
+    DM_API_SERVICES_IMPORT_BATCH_SIZE = 500
     DM_API_SUPPLIERS_PAGE_SIZE = 100
+    DM_API_AUDIT_EVENTS_EXPORT_BATCH_SIZE = 500
+
+    # Seconds each process keeps its copies of the frameworks and lots
+    DM_FRAMEWORK_REGISTRY_TTL = 60
+
+    # Seconds each process keeps the user names shown on audit events
+    DM_USER_NAME_CACHE_TTL = 300
+    DM_USER_NAME_CACHE_SIZE = 1000
+
+    # Seconds each process keeps framework stats. With 'background' refresh
+    # they're read from the table kept up to date by `refresh_framework_stats`
+    # instead of being calculated by requests.
+    DM_FRAMEWORK_STATS_TTL = 60
+    DM_FRAMEWORK_STATS_REFRESH = 'request'
+    DM_FRAMEWORK_STATS_REFRESH_INTERVAL = 300
+
+    # Responses smaller than this aren't worth compressing
+    DM_API_COMPRESSION_MIN_SIZE = 1024
+    DM_API_COMPRESSION_LEVEL = 6
+
+    # Search index update worker
+    DM_SEARCH_INDEX_BATCH_SIZE = 100
+    DM_SEARCH_INDEX_POLL_INTERVAL = 5
+    DM_SEARCH_INDEX_MAX_ATTEMPTS = 5
+    DM_SEARCH_INDEX_RETRY_DELAY = 30
+
     SQLALCHEMY_COMMIT_ON_TEARDOWN = False
     SQLALCHEMY_RECORD_QUERIES = True
+    # Send each request's query count and time in X-DB-Queries and X-DB-Time
+    DM_DB_QUERY_HEADERS = True
     SQLALCHEMY_DATABASE_URI = 'postgresql://localhost/digitalmarketplace'
+    # Connection pool: requests wait up to SQLALCHEMY_POOL_TIMEOUT seconds
+    # once POOL_SIZE + MAX_OVERFLOW connections are checked out
+    SQLALCHEMY_POOL_SIZE = 5
+    SQLALCHEMY_MAX_OVERFLOW = 10
+    SQLALCHEMY_POOL_TIMEOUT = 10
+    SQLALCHEMY_POOL_RECYCLE = 3600
+    # Connecting through a transaction pooler (eg pgbouncer): don't keep a
+    # pool in the app or leave any session state on the connection
+    DM_DB_TRANSACTION_POOLING = False
+    # Add a 'replica' bind to send reads in GET requests to a read replica
+    SQLALCHEMY_BINDS = None
 
     DM_FAILED_LOGIN_LIMIT = 5
 
@@ -42,6 +83,10 @@ class Test(Config):
     SQLALCHEMY_DATABASE_URI = 'postgresql://localhost/digitalmarketplace_test'
     DM_API_SERVICES_PAGE_SIZE = 5
     DM_API_SUPPLIERS_PAGE_SIZE = 5
+    # Tests change frameworks and users directly in the database
+    DM_FRAMEWORK_REGISTRY_TTL = 0
+    DM_USER_NAME_CACHE_TTL = 0
+    DM_FRAMEWORK_STATS_TTL = 0
     FEATURE_FLAGS_TRANSACTION_ISOLATION = enabled_since('2015-08-27')
 
 
@@ -54,6 +99,10 @@ class Live(Config):
     DEBUG = False
     ALLOW_EXPLORER = False
     DM_HTTP_PROTO = 'https'
+    DM_DB_QUERY_HEADERS = False
+    SQLALCHEMY_POOL_SIZE = 10
+    SQLALCHEMY_MAX_OVERFLOW = 20
+    SQLALCHEMY_POOL_RECYCLE = 300
 
 
 class Preview(Live):
@@ -0,0 +1,30 @@
+"""Add serialized_services table to cache serialized service documents
+
+Revision ID: 440
+Revises: 430
+Create Date: 2015-11-20 10:21:47.195620
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '440'
+down_revision = '430'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+def upgrade():
+    op.create_table(
+        'serialized_services',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('data', postgresql.JSON(), nullable=False),
+        sa.ForeignKeyConstraint(['id'], ['services.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('serialized_services')
@@ -0,0 +1,34 @@
+"""Add search_index_updates table to queue changes for the search API
+
+Revision ID: 450
+Revises: 440
+Create Date: 2015-11-24 14:02:11.408315
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '450'
+down_revision = '440'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'search_index_updates',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('service_id', sa.String(), nullable=False),
+        sa.Column('action', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_search_index_updates_service_id'), 'search_index_updates', ['service_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_search_index_updates_service_id'), table_name='search_index_updates')
+    op.drop_table('search_index_updates')
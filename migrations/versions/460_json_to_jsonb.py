@@ -0,0 +1,45 @@
+"""Convert JSON columns to JSONB and add GIN indexes on service data
+
+JSONB needs Postgres 9.4 or later.
+
+Revision ID: 460
+Revises: 450
+Create Date: 2015-11-26 11:37:52.640217
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '460'
+down_revision = '450'
+
+from alembic import op
+
+
+JSON_COLUMNS = [
+    ('services', 'data'),
+    ('draft_services', 'data'),
+    ('archived_services', 'data'),
+    ('supplier_frameworks', 'declaration'),
+    ('audit_events', 'data'),
+    ('suppliers', 'clients'),
+]
+
+GIN_INDEXED_TABLES = ['services', 'draft_services']
+
+
+def upgrade():
+    # Changing the column type rebuilds the indexes that use it, including
+    # the expression index ix_service_ordering
+    for table, column in JSON_COLUMNS:
+        op.execute('ALTER TABLE {0} ALTER COLUMN {1} TYPE jsonb USING {1}::jsonb'.format(table, column))
+
+    for table in GIN_INDEXED_TABLES:
+        op.execute('CREATE INDEX ix_{0}_data_gin ON {0} USING gin (data jsonb_path_ops)'.format(table))
+
+
+def downgrade():
+    for table in GIN_INDEXED_TABLES:
+        op.execute('DROP INDEX ix_{0}_data_gin'.format(table))
+
+    for table, column in JSON_COLUMNS:
+        op.execute('ALTER TABLE {0} ALTER COLUMN {1} TYPE json USING {1}::json'.format(table, column))
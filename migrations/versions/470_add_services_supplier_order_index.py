@@ -0,0 +1,24 @@
+"""Add an index matching the order of a supplier's paginated service list
+
+Revision ID: 470
+Revises: 460
+Create Date: 2015-11-30 14:12:05.318406
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '470'
+down_revision = '460'
+
+from alembic import op
+
+
+def upgrade():
+    op.execute(
+        "CREATE INDEX ix_services_supplier_order ON services "
+        "(supplier_id, framework_id, lot_id, (data ->> 'serviceName'), id)"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX ix_services_supplier_order")
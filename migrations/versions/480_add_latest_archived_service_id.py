@@ -0,0 +1,34 @@
+"""Add services.latest_archived_service_id and backfill it from archived_services
+
+Revision ID: 480
+Revises: 470
+Create Date: 2015-12-02 10:41:26.904117
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '480'
+down_revision = '470'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('services', sa.Column('latest_archived_service_id', sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        'services_latest_archived_service_id_fkey', 'services', 'archived_services',
+        ['latest_archived_service_id'], ['id']
+    )
+    op.execute("""
+        UPDATE services SET latest_archived_service_id = latest.id
+        FROM (
+            SELECT service_id, max(id) AS id FROM archived_services GROUP BY service_id
+        ) AS latest
+        WHERE latest.service_id = services.service_id
+    """)
+
+
+def downgrade():
+    op.drop_constraint('services_latest_archived_service_id_fkey', 'services', type_='foreignkey')
+    op.drop_column('services', 'latest_archived_service_id')
@@ -0,0 +1,26 @@
+"""Replace the audit_events created_at index with one on (created_at, id)
+
+The (created_at, id) index serves keyset paging as well as date ranges
+and ordering by created_at, so ix_audit_events_created_at is dropped.
+
+Revision ID: 500
+Revises: 480
+Create Date: 2015-12-07 11:05:39.552741
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '500'
+down_revision = '480'
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index('ix_audit_events_created_at_id', 'audit_events', ['created_at', 'id'], unique=False)
+    op.drop_index('ix_audit_events_created_at', table_name='audit_events')
+
+
+def downgrade():
+    op.create_index('ix_audit_events_created_at', 'audit_events', ['created_at'], unique=False)
+    op.drop_index('ix_audit_events_created_at_id', table_name='audit_events')
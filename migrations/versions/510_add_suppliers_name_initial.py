@@ -0,0 +1,31 @@
+"""Add an indexed suppliers.name_initial for the A to Z supplier directory
+
+Revision ID: 510
+Revises: 500
+Create Date: 2015-12-08 15:32:11.270934
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '510'
+down_revision = '500'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('suppliers', sa.Column('name_initial', sa.String(length=1), nullable=True))
+    op.execute("""
+        UPDATE suppliers SET name_initial = CASE
+            WHEN name ~ '^[A-Za-z]' THEN upper(left(name, 1))
+            ELSE '#'
+        END
+    """)
+    op.alter_column('suppliers', 'name_initial', nullable=False)
+    op.create_index('ix_suppliers_name_initial', 'suppliers', ['name_initial', 'name', 'supplier_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_suppliers_name_initial', table_name='suppliers')
+    op.drop_column('suppliers', 'name_initial')
@@ -0,0 +1,37 @@
+"""Add supplier_live_frameworks, the frameworks each supplier has published services on
+
+Revision ID: 520
+Revises: 510
+Create Date: 2015-12-09 12:48:57.663018
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '520'
+down_revision = '510'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'supplier_live_frameworks',
+        sa.Column('supplier_id', sa.BigInteger(), nullable=False),
+        sa.Column('framework_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['framework_id'], ['frameworks.id'], ),
+        sa.ForeignKeyConstraint(['supplier_id'], ['suppliers.supplier_id'], ),
+        sa.PrimaryKeyConstraint('supplier_id', 'framework_id')
+    )
+    op.create_index(
+        op.f('ix_supplier_live_frameworks_framework_id'), 'supplier_live_frameworks', ['framework_id'], unique=False
+    )
+    op.execute("""
+        INSERT INTO supplier_live_frameworks (supplier_id, framework_id)
+        SELECT DISTINCT supplier_id, framework_id FROM services WHERE status = 'published'
+    """)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_supplier_live_frameworks_framework_id'), table_name='supplier_live_frameworks')
+    op.drop_table('supplier_live_frameworks')
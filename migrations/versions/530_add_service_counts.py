@@ -0,0 +1,42 @@
+"""Add service_counts, the number of each supplier's services and drafts by lot and status
+
+Revision ID: 530
+Revises: 520
+Create Date: 2015-12-14 10:21:36.402871
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '530'
+down_revision = '520'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'service_counts',
+        sa.Column('supplier_id', sa.BigInteger(), nullable=False),
+        sa.Column('framework_id', sa.Integer(), nullable=False),
+        sa.Column('lot_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['framework_id'], ['frameworks.id'], ),
+        sa.ForeignKeyConstraint(['lot_id'], ['lots.id'], ),
+        sa.ForeignKeyConstraint(['supplier_id'], ['suppliers.supplier_id'], ),
+        sa.PrimaryKeyConstraint('supplier_id', 'framework_id', 'lot_id', 'status', 'kind')
+    )
+    op.execute("""
+        INSERT INTO service_counts (supplier_id, framework_id, lot_id, status, kind, count)
+        SELECT supplier_id, framework_id, lot_id, status, 'service', count(*)
+        FROM services GROUP BY supplier_id, framework_id, lot_id, status
+        UNION ALL
+        SELECT supplier_id, framework_id, lot_id, status, 'draft', count(*)
+        FROM draft_services GROUP BY supplier_id, framework_id, lot_id, status
+    """)
+
+
+def downgrade():
+    op.drop_table('service_counts')
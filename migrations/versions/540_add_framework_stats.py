@@ -0,0 +1,30 @@
+"""Add framework_stats, the last stats calculated for each framework
+
+Revision ID: 540
+Revises: 530
+Create Date: 2015-12-15 16:05:42.118530
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '540'
+down_revision = '530'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+def upgrade():
+    op.create_table(
+        'framework_stats',
+        sa.Column('framework_id', sa.Integer(), nullable=False),
+        sa.Column('stats', postgresql.JSONB(), nullable=False),
+        sa.Column('calculated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['framework_id'], ['frameworks.id'], ),
+        sa.PrimaryKeyConstraint('framework_id')
+    )
+
+
+def downgrade():
+    op.drop_table('framework_stats')
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""Compare ways of filtering audit events by day on a synthetic table
+
+Creates an unlogged `audit_events_benchmark` table with the same columns
+as `audit_events`, filled with <rows> events spread evenly over three
+years in created_at order, as audit events are written. It then times a
+page of a single day's events filtered with the old `created_at::date`
+cast and with the half-open timestamp range `list_audits` now uses, first
+with the btree index on created_at and then, on Postgres 9.5 or later,
+with a BRIN index instead. The table is dropped afterwards unless --keep
+is given.
+
+Usage:
+    benchmark_audit_date_filter.py [--rows=<n>] [--number=<n>] [--keep]
+
+Options:
+    --rows=<n>    Number of synthetic audit events [default: 10000000]
+    --number=<n>  Number of times to run each query [default: 20]
+    --keep        Don't drop the table at the end
+
+Example:
+    DM_ENVIRONMENT=development ./scripts/benchmark_audit_date_filter.py --rows=1000000
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+from docopt import docopt
+
+sys.path.insert(0, '.')  # noqa
+
+from app import create_app, db
+
+
+CREATE_TABLE = """
+    CREATE UNLOGGED TABLE audit_events_benchmark AS
+    SELECT
+        i AS id,
+        'update_service'::varchar AS type,
+        timestamp '2013-01-01' + (i * interval '3 years' / :rows) AS created_at,
+        'user@example.com'::varchar AS "user",
+        '{"serviceId": "1234567890123456"}'::jsonb AS data,
+        'Service'::varchar AS object_type,
+        i::bigint AS object_id,
+        false AS acknowledged
+    FROM generate_series(1, :rows) AS i
+"""
+
+QUERIES = [
+    ("created_at::date = day", """
+        SELECT * FROM audit_events_benchmark
+        WHERE CAST(created_at AS DATE) = :day
+        ORDER BY created_at LIMIT 100
+    """),
+    ("half-open range", """
+        SELECT * FROM audit_events_benchmark
+        WHERE created_at >= :day AND created_at < CAST(:day AS DATE) + 1
+        ORDER BY created_at LIMIT 100
+    """),
+]
+
+
+def milliseconds_per_run(function, number):
+    return 1000 * timeit.timeit(function, number=number) / number
+
+
+def index_size(name):
+    return db.session.execute(
+        "SELECT pg_size_pretty(pg_relation_size(CAST(:name AS regclass)))", {'name': name}
+    ).scalar()
+
+
+def time_queries(number):
+    for name, query in QUERIES:
+        print("    {:<24} {:.1f}ms".format(name + ':', milliseconds_per_run(
+            lambda: db.session.execute(query, {'day': '2014-06-15'}).fetchall(), number)))
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    rows = int(arguments['--rows'])
+    number = int(arguments['--number'])
+
+    application = create_app(os.getenv('DM_ENVIRONMENT') or 'development')
+    with application.app_context():
+        print("Creating audit_events_benchmark with {} rows".format(rows))
+        db.session.execute("DROP TABLE IF EXISTS audit_events_benchmark")
+        db.session.execute(CREATE_TABLE, {'rows': rows})
+        db.session.execute("ANALYZE audit_events_benchmark")
+
+        try:
+            print("Without an index on created_at:")
+            time_queries(number)
+
+            db.session.execute("CREATE INDEX ix_audit_events_benchmark_btree ON audit_events_benchmark (created_at)")
+            print("With a btree index ({}):".format(index_size('ix_audit_events_benchmark_btree')))
+            time_queries(number)
+            db.session.execute("DROP INDEX ix_audit_events_benchmark_btree")
+
+            if db.engine.dialect.server_version_info >= (9, 5):
+                db.session.execute(
+                    "CREATE INDEX ix_audit_events_benchmark_brin ON audit_events_benchmark USING brin (created_at)")
+                print("With a BRIN index ({}):".format(index_size('ix_audit_events_benchmark_brin')))
+                time_queries(number)
+            else:
+                print("BRIN indexes need Postgres 9.5 or later")
+        finally:
+            if not arguments['--keep']:
+                db.session.execute("DROP TABLE audit_events_benchmark")
+            db.session.commit()
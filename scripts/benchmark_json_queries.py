@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""Time the queries that read inside JSON columns
+
+Runs the framework stats queries, which group by `declaration->'status'`,
+and the supplier service listing, which sorts by `data->>'serviceName'`,
+against the database configured for DM_ENVIRONMENT. Run it before and
+after the JSONB migration to compare.
+
+Usage:
+    benchmark_json_queries.py [--framework=<slug>] [--number=<n>]
+
+Options:
+    --framework=<slug>  Framework to fetch stats and services for [default: g-cloud-7]
+    --number=<n>        Number of times to run each query [default: 20]
+
+Example:
+    DM_ENVIRONMENT=development ./scripts/benchmark_json_queries.py --number=50
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+from docopt import docopt
+from sqlalchemy import func
+
+sys.path.insert(0, '.')  # noqa
+
+from app import create_app, db
+from app.models import Framework, Service
+from app.framework_utils import calculate_framework_stats
+
+
+def milliseconds_per_run(function, number):
+    return 1000 * timeit.timeit(function, number=number) / number
+
+
+def column_type(table, column):
+    return db.session.execute(
+        "SELECT data_type FROM information_schema.columns WHERE table_name = :table AND column_name = :column",
+        {'table': table, 'column': column}
+    ).scalar()
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    framework_slug = arguments['--framework']
+    number = int(arguments['--number'])
+
+    application = create_app(os.getenv('DM_ENVIRONMENT') or 'development')
+    with application.test_request_context():
+        framework = Framework.query.filter(Framework.slug == framework_slug).first()
+
+        # Pick the supplier with the most services on the framework
+        supplier_id = db.session.query(Service.supplier_id).filter(
+            Service.framework.has(slug=framework_slug)
+        ).group_by(Service.supplier_id).order_by(func.count().desc()).limit(1).scalar()
+
+        def list_supplier_services():
+            Service.query.has_frameworks(framework_slug).default_order().filter(
+                Service.supplier_id == supplier_id
+            ).all()
+
+        print("services.data is {}, supplier_frameworks.declaration is {}".format(
+            column_type('services', 'data'), column_type('supplier_frameworks', 'declaration')))
+        print("Framework stats:        {:.1f}ms".format(
+            milliseconds_per_run(lambda: calculate_framework_stats(framework), number)))
+        print("Supplier services list: {:.1f}ms".format(
+            milliseconds_per_run(list_supplier_services, number)))
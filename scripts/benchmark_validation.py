@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""Measure service validations per second with and without the validator cache
+
+Validates an example G-Cloud 7 listing the way `edit_draft_service` does,
+with `enforce_required=False` and a page's worth of required fields.
+
+Usage:
+    benchmark_validation.py [--number=<n>]
+
+Options:
+    --number=<n>    Number of validations to time [default: 1000]
+
+Example:
+    ./scripts/benchmark_validation.py --number=500
+"""
+
+from __future__ import print_function
+
+import json
+import sys
+import timeit
+
+from docopt import docopt
+
+sys.path.insert(0, '.')  # noqa
+
+from app.validation import build_partial_schema, build_validator, get_validator
+
+SCHEMA_NAME = 'services-g-cloud-7-scs'
+REQUIRED_FIELDS = ['serviceName', 'serviceSummary', 'serviceBenefits', 'serviceFeatures']
+
+
+def build_uncached_validator(schema_name, enforce_required, required_fields):
+    return build_validator(build_partial_schema(schema_name, required_fields))
+
+
+def validations_per_second(get_validator_function, data, number):
+    def validate():
+        errors = get_validator_function(
+            SCHEMA_NAME, enforce_required=False, required_fields=REQUIRED_FIELDS
+        ).iter_errors(data)
+        list(errors)
+
+    return number / timeit.timeit(validate, number=number)
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    number = int(arguments['--number'])
+
+    with open('example_listings/G7-SCS.json') as f:
+        data = json.load(f)
+
+    uncached = validations_per_second(build_uncached_validator, data, number)
+    cached = validations_per_second(get_validator, data, number)
+
+    print("Without validator cache: {:.0f} validations/s".format(uncached))
+    print("With validator cache:    {:.0f} validations/s".format(cached))
+    print("Speedup: {:.1f}x".format(cached / uncached))
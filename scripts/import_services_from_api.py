@@ -7,6 +7,10 @@ Usage:
                                 [options]
 
     --serial        Do not run in parallel (useful for debugging)
+    --export        Read source services from the streaming /services/export
+                    endpoint instead of paging through /services
+    --bulk          Import each batch of 100 services with a single request
+                    to the target API's bulk import endpoint
 
 Example:
     ./import_services_from_api.py http://api myToken http://source-api token
@@ -16,11 +20,13 @@ from __future__ import print_function
 from six.moves import map
 
 import getpass
+import json
 import sys
 import multiprocessing
 from itertools import islice
 from datetime import datetime
 
+import requests
 from docopt import docopt
 from dmutils import apiclient
 
@@ -64,6 +70,19 @@ def request_services(api_url, api_access_token, page=1):
             return
 
 
+def request_exported_services(api_url, api_access_token):
+    response = requests.get(
+        '{}/services/export'.format(api_url.rstrip('/')),
+        headers={'Authorization': 'Bearer {}'.format(api_access_token)},
+        stream=True,
+    )
+    response.raise_for_status()
+
+    for line in response.iter_lines():
+        if line:
+            yield json.loads(line.decode('utf-8'))
+
+
 def print_progress(counter, start_time):
     if counter % 100 == 0:
         time_delta = datetime.utcnow() - start_time
@@ -118,8 +137,38 @@ class ServiceUpdater(object):
         return service
 
 
+class BulkServiceUpdater(ServiceUpdater):
+    def __call__(self, services):
+        payload = [self.clean_data(self.update_data(service)) for service in services]
+
+        try:
+            response = requests.put(
+                '{}/services'.format(self.endpoint.rstrip('/')),
+                data=json.dumps({
+                    'update_details': {'updated_by': getpass.getuser()},
+                    'services': payload,
+                }),
+                headers={
+                    'Content-Type': 'application/json',
+                    'Authorization': 'Bearer {}'.format(self.access_token),
+                }
+            )
+            results = response.json()['services']
+        except (requests.RequestException, ValueError, KeyError) as e:
+            print("ERROR: {}. Batch of {} services not imported".format(e, len(services)),
+                  file=sys.stderr)
+            return [False] * len(services)
+
+        for result in results:
+            if result['result'] != 'created':
+                print("ERROR: {}. {} not imported".format(result['error'], result['id']),
+                      file=sys.stderr)
+
+        return [result['result'] == 'created' for result in results]
+
+
 def do_index(api_url, api_access_token, source_api_url,
-             source_api_access_token, serial):
+             source_api_access_token, serial, export=False, bulk=False):
     print("Data API URL: {}".format(api_url))
     print("Source Data API URL: {}".format(source_api_url))
 
@@ -136,7 +185,10 @@ def do_index(api_url, api_access_token, source_api_url,
     start_time = datetime.utcnow()
     status = True
 
-    iter_services = request_services(source_api_url, source_api_access_token)
+    if export:
+        iter_services = request_exported_services(source_api_url, source_api_access_token)
+    else:
+        iter_services = request_services(source_api_url, source_api_access_token)
     services = True
     while services:
         try:
@@ -144,8 +196,16 @@ def do_index(api_url, api_access_token, source_api_url,
         except apiclient.APIError as e:
             print('API request failed: {}'.format(e.message), file=sys.stderr)
             return False
+        except requests.RequestException as e:
+            print('API request failed: {}'.format(e), file=sys.stderr)
+            return False
+
+        if bulk:
+            results = BulkServiceUpdater(api_url, api_access_token)(services) if services else []
+        else:
+            results = mapper(indexer, services)
 
-        for result in mapper(indexer, services):
+        for result in results:
             counter += 1
             status = status and result
             print_progress(counter, start_time)
@@ -162,6 +222,8 @@ if __name__ == "__main__":
         source_api_url=arguments['<source_api_endpoint>'],
         source_api_access_token=arguments['<source_api_access_token>'],
         serial=arguments['--serial'],
+        export=arguments['--export'],
+        bulk=arguments['--bulk'],
     )
 
     if not ok:
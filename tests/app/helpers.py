@@ -8,6 +8,7 @@ from nose.tools import assert_equal, assert_in
 
 from app import create_app, db
 from app.models import Service, Supplier, ContactInformation, Framework, Lot
+from app.service_utils import send_search_index_updates
 
 TEST_SUPPLIERS_COUNT = 3
 
@@ -185,6 +186,11 @@ class BaseApplicationTest(object):
         Framework.query.filter_by(slug=slug).update({'status': status})
         db.session.commit()
 
+    def send_search_index_updates(self):
+        """Run the search index worker over everything that's been queued"""
+        with self.app.test_request_context():
+            return send_search_index_updates(batch_size=100)
+
 
 class JSONUpdateTestMixin(object):
     """
@@ -0,0 +1,96 @@
+from datetime import datetime
+
+from nose.tools import assert_equal, assert_not_in
+
+from app import db
+from app.models import User, AuditEvent
+from app.audit_utils import UserNameCache, serialize_audit_events
+from dmutils.audit import AuditTypes
+
+from .helpers import BaseApplicationTest
+
+
+class TestUserNameCache(BaseApplicationTest):
+    def setup(self):
+        super(TestUserNameCache, self).setup()
+        now = datetime.utcnow()
+        with self.app.app_context():
+            for i in range(2):
+                db.session.add(User(
+                    email_address='user{}@example.com'.format(i),
+                    name='User {}'.format(i),
+                    password='password',
+                    active=True,
+                    role='admin',
+                    password_changed_at=now,
+                ))
+            db.session.commit()
+
+    def rename_user(self, email_address, name):
+        User.query.filter(User.email_address == email_address).update({'name': name})
+        db.session.commit()
+
+    def test_get_names_returns_names_and_none_for_unknown_addresses(self):
+        with self.app.app_context():
+            names = UserNameCache(ttl=60, max_size=10).get_names(
+                ['user0@example.com', 'user1@example.com', 'user0@example.com', 'joeblogs', None]
+            )
+
+            assert_equal(names, {
+                'user0@example.com': 'User 0',
+                'user1@example.com': 'User 1',
+                'joeblogs': None,
+            })
+
+    def test_names_are_cached(self):
+        with self.app.app_context():
+            cache = UserNameCache(ttl=60, max_size=10)
+            cache.get_names(['user0@example.com'])
+            self.rename_user('user0@example.com', 'Renamed')
+
+            assert_equal(cache.get_names(['user0@example.com']), {'user0@example.com': 'User 0'})
+
+    def test_expired_names_are_looked_up_again(self):
+        with self.app.app_context():
+            cache = UserNameCache(ttl=0, max_size=10)
+            cache.get_names(['user0@example.com'])
+            self.rename_user('user0@example.com', 'Renamed')
+
+            assert_equal(cache.get_names(['user0@example.com']), {'user0@example.com': 'Renamed'})
+
+    def test_cache_is_emptied_when_full(self):
+        with self.app.app_context():
+            cache = UserNameCache(ttl=60, max_size=1)
+            cache.get_names(['user0@example.com'])
+            self.rename_user('user0@example.com', 'Renamed')
+            cache.get_names(['user1@example.com'])
+
+            assert_equal(cache.get_names(['user0@example.com']), {'user0@example.com': 'Renamed'})
+
+    def test_serialize_audit_events_with_user_names(self):
+        with self.app.test_request_context():
+            events = [
+                AuditEvent(AuditTypes.supplier_update, user, {}, None)
+                for user in ['user0@example.com', 'joeblogs']
+            ]
+            db.session.add_all(events)
+            db.session.commit()
+
+            serialized = serialize_audit_events(events, include_user=True)
+
+            assert_equal(serialized[0]['userName'], 'User 0')
+            assert_not_in('userName', serialized[1])
+            assert_not_in('userName', serialize_audit_events(events)[0])
+
+    def test_serialize_audit_events_can_skip_the_cache(self):
+        self.app.config['DM_USER_NAME_CACHE_TTL'] = 60
+        with self.app.test_request_context():
+            event = AuditEvent(AuditTypes.supplier_update, 'user0@example.com', {}, None)
+            db.session.add(event)
+            db.session.commit()
+
+            serialize_audit_events([event], include_user=True)
+            self.rename_user('user0@example.com', 'Renamed')
+
+            assert_equal(serialize_audit_events([event], include_user=True)[0]['userName'], 'User 0')
+            assert_equal(serialize_audit_events([event], include_user=True, cached=False)[0]['userName'], 'Renamed')
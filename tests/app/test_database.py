@@ -0,0 +1,91 @@
+import pytest
+
+from flask import g
+from nose.tools import assert_equal, assert_true
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import NullPool
+
+from app import db
+from app.database import MonitoredQueuePool, get_pool_status
+from app.models import Service
+
+from .helpers import BaseApplicationTest
+
+
+class TestMonitoredQueuePool(object):
+    def setup(self):
+        self.engine = create_engine(
+            'sqlite://', poolclass=MonitoredQueuePool, pool_size=1, max_overflow=1, pool_timeout=0.01
+        )
+
+    def test_counts_checked_out_and_overflow_connections(self):
+        first = self.engine.connect()
+        second = self.engine.connect()
+
+        status = get_pool_status(self.engine)
+        assert_equal(status['mode'], 'queue')
+        assert_equal(status['checkedOut'], 2)
+        assert_equal(status['overflow'], 1)
+        assert_equal(status['checkouts'], 2)
+
+        first.close()
+        second.close()
+        assert_equal(get_pool_status(self.engine)['checkedOut'], 0)
+
+    def test_counts_timeouts_and_wait_time(self):
+        connections = [self.engine.connect(), self.engine.connect()]
+
+        with pytest.raises(TimeoutError):
+            self.engine.connect()
+
+        status = get_pool_status(self.engine)
+        assert_equal(status['timeouts'], 1)
+        assert_true(status['maxWaitTime'] > 0)
+
+        for connection in connections:
+            connection.close()
+
+
+def test_pool_status_without_app_pool():
+    engine = create_engine('sqlite://', poolclass=NullPool)
+
+    assert_equal(get_pool_status(engine), {'mode': 'transaction'})
+
+
+class TestRoutingSession(BaseApplicationTest):
+    def setup(self):
+        super(TestRoutingSession, self).setup()
+        self.app.config['SQLALCHEMY_BINDS'] = {'replica': self.app.config['SQLALCHEMY_DATABASE_URI']}
+
+    def teardown(self):
+        if self.app.config['SQLALCHEMY_BINDS']:
+            with self.app.app_context():
+                db.get_engine(self.app, bind='replica').dispose()
+        super(TestRoutingSession, self).teardown()
+
+    def get_select_bind(self):
+        return db.session.get_bind(Service.__mapper__, select([Service.id]))
+
+    def test_selects_in_get_requests_use_the_replica(self):
+        with self.app.test_request_context('/', method='GET'):
+            assert_equal(self.get_select_bind(), db.get_engine(self.app, bind='replica'))
+
+    def test_selects_in_post_requests_use_the_primary(self):
+        with self.app.test_request_context('/', method='POST'):
+            assert_equal(self.get_select_bind(), db.engine)
+
+    def test_views_can_read_from_the_primary(self):
+        with self.app.test_request_context('/', method='GET'):
+            g.read_from_primary = True
+            assert_equal(self.get_select_bind(), db.engine)
+
+    def test_session_uses_the_primary_after_a_flush(self):
+        with self.app.test_request_context('/', method='GET'):
+            db.session.info['wrote'] = True
+            assert_equal(self.get_select_bind(), db.engine)
+
+    def test_selects_use_the_primary_without_a_replica(self):
+        self.app.config['SQLALCHEMY_BINDS'] = None
+        with self.app.test_request_context('/', method='GET'):
+            assert_equal(self.get_select_bind(), db.engine)
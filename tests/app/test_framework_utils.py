@@ -0,0 +1,136 @@
+import threading
+
+import pytest
+
+from nose.tools import assert_equal, assert_in, assert_is_none
+from werkzeug.exceptions import NotFound
+
+from app import db
+from app.models import Framework
+from app.framework_utils import FrameworkRegistry, FrameworkStatsCache, get_framework_or_404
+
+from .helpers import BaseApplicationTest
+
+
+class TestFrameworkRegistry(BaseApplicationTest):
+    def setup(self):
+        super(TestFrameworkRegistry, self).setup()
+        with self.app.app_context():
+            db.session.add(Framework(
+                id=101, name='Example', framework='gcloud', slug='example', status='open'
+            ))
+            db.session.commit()
+
+    def set_example_status(self, status):
+        Framework.query.filter(Framework.slug == 'example').update({'status': status})
+        db.session.commit()
+
+    def test_get_by_slug_returns_framework_with_lots(self):
+        with self.app.app_context():
+            framework = FrameworkRegistry(ttl=60).get_by_slug('g-cloud-6')
+
+            assert_equal(framework.slug, 'g-cloud-6')
+            assert_equal([lot.slug for lot in framework.lots], ['saas', 'paas', 'iaas', 'scs'])
+            assert_in(framework, db.session)
+
+    def test_get_by_id_returns_framework(self):
+        with self.app.app_context():
+            assert_equal(FrameworkRegistry(ttl=60).get_by_id(101).slug, 'example')
+
+    def test_unknown_framework_is_none(self):
+        with self.app.app_context():
+            assert_is_none(FrameworkRegistry(ttl=60).get_by_slug('not-a-framework'))
+
+    def test_frameworks_are_cached_until_invalidated(self):
+        with self.app.app_context():
+            registry = FrameworkRegistry(ttl=3600)
+            registry.get_by_slug('example')
+            self.set_example_status('live')
+            db.session.remove()
+
+            assert_equal(registry.get_by_slug('example').status, 'open')
+
+            registry.invalidate()
+            db.session.remove()
+
+            assert_equal(registry.get_by_slug('example').status, 'live')
+
+    def test_frameworks_are_reloaded_after_ttl(self):
+        with self.app.app_context():
+            registry = FrameworkRegistry(ttl=0)
+            registry.get_by_slug('example')
+            self.set_example_status('live')
+            db.session.remove()
+
+            assert_equal(registry.get_by_slug('example').status, 'live')
+
+    def test_frameworks_in_the_session_are_not_replaced_by_cached_copies(self):
+        with self.app.app_context():
+            registry = FrameworkRegistry(ttl=3600)
+            registry.get_by_slug('example')
+            self.set_example_status('live')
+            db.session.remove()
+
+            framework = Framework.query.filter(Framework.slug == 'example').first()
+
+            assert registry.get_by_slug('example') is framework
+            assert_equal(framework.status, 'live')
+            assert_equal(registry.get_by_id(101).status, 'live')
+
+    def test_get_framework_or_404(self):
+        with self.app.app_context():
+            assert_equal(get_framework_or_404('example').id, 101)
+            with pytest.raises(NotFound):
+                get_framework_or_404('not-a-framework')
+
+
+class TestFrameworkStatsCache(object):
+    def setup(self):
+        self.framework = Framework(id=101, slug='example')
+        self.loads = []
+
+    def load(self, framework):
+        self.loads.append(framework.id)
+        return {'loads': len(self.loads)}
+
+    def test_stats_are_cached_until_ttl(self):
+        cache = FrameworkStatsCache(ttl=3600, load=self.load)
+
+        assert_equal(cache.get(self.framework), {'loads': 1})
+        assert_equal(cache.get(self.framework), {'loads': 1})
+        assert_equal(self.loads, [101])
+
+    def test_stats_are_reloaded_after_ttl(self):
+        cache = FrameworkStatsCache(ttl=0, load=self.load)
+
+        assert_equal(cache.get(self.framework), {'loads': 1})
+        assert_equal(cache.get(self.framework), {'loads': 2})
+
+    def test_missing_stats_are_not_cached(self):
+        cache = FrameworkStatsCache(ttl=3600, load=lambda framework: self.loads.append(framework.id))
+
+        assert_is_none(cache.get(self.framework))
+        assert_is_none(cache.get(self.framework))
+        assert_equal(self.loads, [101, 101])
+
+    def test_expired_stats_are_returned_while_another_thread_loads(self):
+        loading, finish_loading = threading.Event(), threading.Event()
+
+        def slow_load(framework):
+            if self.loads:
+                loading.set()
+                finish_loading.wait(5)
+            return self.load(framework)
+
+        cache = FrameworkStatsCache(ttl=0, load=slow_load)
+        cache.get(self.framework)
+
+        thread = threading.Thread(target=cache.get, args=(self.framework,))
+        thread.start()
+        loading.wait(5)
+
+        assert_equal(cache.get(self.framework), {'loads': 1})
+
+        finish_loading.set()
+        thread.join()
+        assert_equal(self.loads, [101, 101])
@@ -1,9 +1,9 @@
 from datetime import datetime
 
-from nose.tools import assert_equal, assert_raises
+from nose.tools import assert_equal, assert_not_in, assert_raises
 
 from app import db, create_app
-from app.models import User, Framework, Service, ValidationError
+from app.models import User, Framework, Service, Supplier, SupplierFramework, ValidationError
 from .helpers import BaseApplicationTest
 
 
@@ -102,6 +102,14 @@ class TestServices(BaseApplicationTest):
 
             assert_equal(services.count(), 1)
 
+    def test_data_can_be_queried_by_containment(self):
+        with self.app.app_context():
+            self.setup_dummy_services_including_unpublished(2)
+
+            services = Service.query.filter(Service.data.contains({'serviceName': 'Service 2000000001'}))
+
+            assert_equal([s.service_id for s in services], ['2000000001'])
+
     def test_service_status(self):
         service = Service(status='enabled')
 
@@ -119,3 +127,26 @@ class TestServices(BaseApplicationTest):
             services = Service.query.has_statuses('published', 'disabled')
 
             assert_equal(services.count(), 2)
+
+
+class TestSupplierFrameworks(BaseApplicationTest):
+    def setup(self):
+        super(TestSupplierFrameworks, self).setup()
+
+        with self.app.app_context():
+            db.session.add(Supplier(supplier_id=1, name=u"Supplier 1"))
+            db.session.add(SupplierFramework(supplier_id=1, framework_id=1))
+            db.session.commit()
+
+    def test_query_without_relationships_does_not_join(self):
+        with self.app.app_context():
+            assert_not_in('JOIN', str(SupplierFramework.query_without_relationships()))
+
+    def test_query_without_relationships_loads_relationships_when_used(self):
+        with self.app.app_context():
+            supplier_framework = SupplierFramework.query_without_relationships().filter(
+                SupplierFramework.supplier_id == 1
+            ).first()
+
+            assert_equal(supplier_framework.supplier.name, u"Supplier 1")
+            assert_equal(supplier_framework.framework.slug, 'g-cloud-6')
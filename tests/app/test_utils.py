@@ -1,6 +1,12 @@
+import gzip
+import io
+import zlib
+
+import mock
 import pytest
 
-from nose.tools import assert_equal
+from flask import jsonify, Response
+from nose.tools import assert_equal, assert_is_not_none, assert_not_in, assert_true
 from werkzeug.exceptions import HTTPException
 
 from .helpers import BaseApplicationTest
@@ -10,7 +16,9 @@ from app.utils import (display_list,
                        json_has_matching_id,
                        json_has_required_keys,
                        link,
-                       purge_nulls_from_data)
+                       purge_nulls_from_data,
+                       with_etag,
+                       compress_response)
 
 
 def test_link():
@@ -68,3 +76,117 @@ def test_purge_nulls():
         'price': 'Not a lot'
     }
     assert_equal(purge_nulls_from_data(service_with_nulls), same_service_without_nulls)
+
+
+class TestWithEtag(BaseApplicationTest):
+    def setup(self):
+        super(TestWithEtag, self).setup()
+
+        @self.app.route('/etag-test/<int:status>')
+        @with_etag
+        def etag_test(status):
+            return jsonify(status=status), status
+
+    def test_successful_response_has_etag(self):
+        response = self.client.get('/etag-test/200')
+
+        assert_equal(response.status_code, 200)
+        assert_is_not_none(response.headers.get('ETag'))
+
+    def test_matching_if_none_match_returns_304_without_body(self):
+        etag = self.client.get('/etag-test/200').headers['ETag']
+
+        response = self.client.get('/etag-test/200', headers={'If-None-Match': etag})
+
+        assert_equal(response.status_code, 304)
+        assert_equal(response.get_data(), b'')
+
+    def test_different_if_none_match_returns_200(self):
+        response = self.client.get('/etag-test/200', headers={'If-None-Match': '"not-the-etag"'})
+
+        assert_equal(response.status_code, 200)
+
+    def test_error_response_has_no_etag(self):
+        response = self.client.get('/etag-test/404')
+
+        assert_equal(response.status_code, 404)
+        assert_equal(response.headers.get('ETag'), None)
+
+
+class TestCompressResponse(BaseApplicationTest):
+    body = b'{"services": []}' * 100
+
+    def compress(self, response, accept_encoding='gzip, deflate'):
+        with self.app.test_request_context(headers={'Accept-Encoding': accept_encoding}):
+            return compress_response(response)
+
+    def test_gzip_is_preferred(self):
+        response = self.compress(Response(self.body))
+
+        assert_equal(response.headers['Content-Encoding'], 'gzip')
+        assert_equal(response.headers['Vary'], 'Accept-Encoding')
+        assert_equal(gzip.GzipFile(fileobj=io.BytesIO(response.get_data())).read(), self.body)
+
+    def test_deflate_is_used_if_gzip_is_not_accepted(self):
+        response = self.compress(Response(self.body), accept_encoding='deflate')
+
+        assert_equal(response.headers['Content-Encoding'], 'deflate')
+        assert_equal(zlib.decompress(response.get_data()), self.body)
+
+    def test_not_compressed_if_client_does_not_accept_it(self):
+        response = self.compress(Response(self.body), accept_encoding='identity')
+
+        assert_equal(response.headers.get('Content-Encoding'), None)
+        assert_equal(response.headers['Vary'], 'Accept-Encoding')
+        assert_equal(response.get_data(), self.body)
+
+    def test_small_responses_are_not_compressed(self):
+        self.app.config['DM_API_COMPRESSION_MIN_SIZE'] = len(self.body) + 1
+
+        response = self.compress(Response(self.body))
+
+        assert_equal(response.headers.get('Content-Encoding'), None)
+        assert_equal(response.get_data(), self.body)
+
+    def test_error_responses_are_not_compressed(self):
+        response = self.compress(Response(self.body, status=400))
+
+        assert_equal(response.headers.get('Content-Encoding'), None)
+
+    def test_streamed_responses_are_not_compressed(self):
+        response = self.compress(Response(iter([self.body])))
+
+        assert_equal(response.headers.get('Content-Encoding'), None)
+
+    def test_strong_etag_is_made_weak(self):
+        response = Response(self.body)
+        response.add_etag()
+
+        response = self.compress(response)
+
+        assert_equal(response.get_etag()[1], True)
+
+
+class TestLogDbQueries(BaseApplicationTest):
+    def test_query_count_and_time_headers(self):
+        response = self.client.get('/services')
+
+        assert_true(int(response.headers['X-DB-Queries']) > 0)
+        assert_true(float(response.headers['X-DB-Time']) >= 0)
+
+    def test_headers_can_be_turned_off(self):
+        self.app.config['DM_DB_QUERY_HEADERS'] = False
+
+        response = self.client.get('/services')
+
+        assert_not_in('X-DB-Queries', response.headers)
+        assert_not_in('X-DB-Time', response.headers)
+
+    def test_queries_are_logged_with_request_id(self):
+        with mock.patch.object(self.app.logger, 'info') as info:
+            response = self.client.get('/services', headers={'DM-Request-ID': 'abc123'})
+
+        extra = info.call_args[1]['extra']
+        assert_equal(extra['request_id'], 'abc123')
+        assert_equal(extra['db_queries'], int(response.headers['X-DB-Queries']))
+        assert_is_not_none(extra['db_slowest_statement'])
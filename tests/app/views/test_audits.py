@@ -3,7 +3,7 @@ from flask import json
 from datetime import datetime
 from app.models import AuditEvent
 from app import db
-from app.models import Supplier
+from app.models import Supplier, User
 from dmutils.audit import AuditTypes
 
 from nose.tools import assert_equal, assert_in, assert_true, assert_false
@@ -66,6 +66,25 @@ class TestAuditEvents(BaseApplicationTest):
         assert_equal(response.status_code, 200)
         assert_equal(len(data['auditEvents']), 0)
 
+    def test_audit_date_includes_whole_day_only(self):
+        self.add_audit_events(4)
+        with self.app.app_context():
+            events = AuditEvent.query.order_by(AuditEvent.id).all()
+            for event, created_at in zip(events, [
+                datetime(2015, 11, 30, 23, 59, 59, 999999),
+                datetime(2015, 12, 1, 0, 0, 0),
+                datetime(2015, 12, 1, 23, 59, 59, 999999),
+                datetime(2015, 12, 2, 0, 0, 0),
+            ]):
+                event.created_at = created_at
+            db.session.commit()
+
+        response = self.client.get('/audit-events?audit-date=2015-12-01')
+        data = json.loads(response.get_data())
+
+        assert_equal(response.status_code, 200)
+        assert_equal([event['user'] for event in data['auditEvents']], ['1', '2'])
+
     def test_should_reject_invalid_audit_dates(self):
         self.add_audit_events(1)
         response = self.client.get('/audit-events?audit-date=invalid')
@@ -206,6 +225,117 @@ class TestAuditEvents(BaseApplicationTest):
         response = self.client.get('/audit-events?per_page=foo')
         assert_equal(response.status_code, 400)
 
+    def test_audit_events_after_id_are_paged_by_created_at_and_id(self):
+        self.add_audit_events(7)
+        with self.app.app_context():
+            # Give the last two events the same created_at as the first
+            events = AuditEvent.query.order_by(AuditEvent.id).all()
+            for event in events[5:]:
+                event.created_at = events[0].created_at
+            db.session.commit()
+
+        response = self.client.get('/audit-events?after_id=0')
+        data = json.loads(response.get_data())
+
+        assert_equal(response.status_code, 200)
+        assert_equal([event['user'] for event in data['auditEvents']], ['0', '5', '6', '1', '2'])
+        assert_in('after_id={}'.format(data['auditEvents'][-1]['id']), data['links']['next'])
+
+        # The test client drops the query string from absolute URLs
+        response = self.client.get(data['links']['next'].replace('http://localhost', ''))
+        data = json.loads(response.get_data())
+
+        assert_equal([event['user'] for event in data['auditEvents']], ['3', '4'])
+        assert_false('next' in data['links'])
+
+    def test_audit_events_after_id_keeps_filters_in_next_link(self):
+        self.add_audit_events(6, AuditTypes.contact_update)
+        self.add_audit_events(1, AuditTypes.supplier_update)
+
+        response = self.client.get('/audit-events?after_id=0&audit-type=contact_update')
+        data = json.loads(response.get_data())
+
+        assert_equal(len(data['auditEvents']), 5)
+        assert_in('audit-type=contact_update', data['links']['next'])
+
+    def test_should_reject_invalid_after_id(self):
+        response = self.client.get('/audit-events?after_id=invalid')
+
+        assert_equal(response.status_code, 400)
+
+    def test_should_reject_unknown_after_id(self):
+        self.add_audit_events(1)
+        response = self.client.get('/audit-events?after_id=1000')
+
+        assert_equal(response.status_code, 400)
+
+    def test_export_streams_filtered_audit_events(self):
+        self.add_audit_events(3, AuditTypes.contact_update)
+        self.add_audit_events(2, AuditTypes.supplier_update)
+
+        response = self.client.get('/audit-events/export?audit-type=contact_update')
+        events = [json.loads(line) for line in response.get_data().splitlines()]
+
+        assert_equal(response.status_code, 200)
+        assert_equal(response.mimetype, 'application/x-ndjson')
+        assert_equal([event['user'] for event in events], ['0', '1', '2'])
+        assert_equal(set(event['type'] for event in events), set(['contact_update']))
+
+    def test_export_rejects_invalid_filters(self):
+        response = self.client.get('/audit-events/export?audit-date=invalid')
+
+        assert_equal(response.status_code, 400)
+
+    def test_should_get_audit_events_with_user_names(self):
+        now = datetime.utcnow()
+        with self.app.app_context():
+            db.session.add(User(
+                email_address='0', name='User Zero', password='password',
+                active=True, role='admin', password_changed_at=now
+            ))
+            db.session.commit()
+        self.add_audit_events(2)
+
+        response = self.client.get('/audit-events?include_user=true')
+        data = json.loads(response.get_data())
+
+        assert_equal(response.status_code, 200)
+        assert_equal(data['auditEvents'][0]['userName'], 'User Zero')
+        assert_false('userName' in data['auditEvents'][1])
+
+    def test_audit_event_user_names_are_cached(self):
+        self.app.config['DM_USER_NAME_CACHE_TTL'] = 60
+        now = datetime.utcnow()
+        with self.app.app_context():
+            db.session.add(User(
+                email_address='0', name='User Zero', password='password',
+                active=True, role='admin', password_changed_at=now
+            ))
+            db.session.commit()
+        self.add_audit_events(1)
+
+        self.client.get('/audit-events?include_user=true')
+        with self.app.app_context():
+            User.query.filter(User.email_address == '0').update({'name': 'Renamed'})
+            db.session.commit()
+
+        for url in ['/audit-events?include_user=true', '/audit-events?include_user=true&after_id=0']:
+            data = json.loads(self.client.get(url).get_data())
+            assert_equal(data['auditEvents'][0]['userName'], 'User Zero')
+
+    def test_should_get_audit_events_without_user_names_by_default(self):
+        self.add_audit_events(1)
+
+        response = self.client.get('/audit-events')
+        data = json.loads(response.get_data())
+
+        assert_false('userName' in data['auditEvents'][0])
+
+    def test_should_reject_invalid_include_user(self):
+        response = self.client.get('/audit-events?include_user=maybe')
+
+        assert_equal(response.status_code, 400)
+
     def test_reject_invalid_audit_id_on_acknowledgement(self):
         res = self.client.post(
             '/audit-events/invalid-id!/acknowledge',
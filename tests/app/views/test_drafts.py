@@ -3,7 +3,7 @@ from datetime import datetime
 from flask import json
 import mock
 from app.models import Supplier, ContactInformation, Service, Framework, \
-    DraftService
+    DraftService, SearchIndexUpdate, User
 from app import db
 
 from nose.tools import assert_equal, assert_in, assert_false
@@ -57,6 +57,11 @@ class TestDraftServices(BaseApplicationTest):
                  'services': payload}),
             content_type='application/json')
 
+        with self.app.app_context():
+            # Only leave the search index updates queued by the tests
+            SearchIndexUpdate.query.delete()
+            db.session.commit()
+
     def service_count(self):
         with self.app.app_context():
             return Service.query.count()
@@ -523,6 +528,26 @@ class TestDraftServices(BaseApplicationTest):
         data = json.loads(res.get_data())
         assert_equal(data['services']['serviceId'], self.service_id)
 
+    def test_should_fetch_a_draft_with_the_current_user_name(self):
+        self.app.config['DM_USER_NAME_CACHE_TTL'] = 60
+        with self.app.app_context():
+            db.session.add(User(
+                email_address='joeblogs', name='Joe Bloggs', password='password',
+                active=True, role='admin', password_changed_at=datetime.utcnow()
+            ))
+            db.session.commit()
+        draft = self.create_draft_service()
+
+        fetch = self.client.get('/draft-services/{}'.format(draft['id']))
+        assert_equal(json.loads(fetch.get_data())['auditEvents']['userName'], 'Joe Bloggs')
+
+        with self.app.app_context():
+            User.query.filter(User.email_address == 'joeblogs').update({'name': 'Renamed'})
+            db.session.commit()
+
+        fetch = self.client.get('/draft-services/{}'.format(draft['id']))
+        assert_equal(json.loads(fetch.get_data())['auditEvents']['userName'], 'Renamed')
+
     def test_invalid_draft_should_have_validation_errors(self):
         res = self.client.post(
             '/draft-services',
@@ -545,6 +570,13 @@ class TestDraftServices(BaseApplicationTest):
         data = json.loads(res.get_data())
         assert not data['validationErrors']
 
+    def test_should_return_304_on_fetch_a_draft_that_is_not_modified(self):
+        draft = self.create_draft_service()
+        etag = self.client.get('/draft-services/{}'.format(draft['id'])).headers['ETag']
+
+        fetch = self.client.get('/draft-services/{}'.format(draft['id']), headers={'If-None-Match': etag})
+        assert_equal(fetch.status_code, 304)
+
     def test_should_404_on_fetch_a_draft_that_doesnt_exist(self):
         fetch = self.client.get('/draft-services/0000000000')
         assert_equal(fetch.status_code, 404)
@@ -789,6 +821,7 @@ class TestDraftServices(BaseApplicationTest):
             json.loads(archives.get_data())['services'][0]['serviceName'],
             'My Iaas Service')
 
+        self.send_search_index_updates()
         assert search_api_client.index.called
 
     def test_should_not_be_able_to_publish_submission_if_not_submitted(self):
@@ -819,6 +852,7 @@ class TestDraftServices(BaseApplicationTest):
         res = self.publish_draft_service(draft_id)
 
         assert res.status_code == 200
+        self.send_search_index_updates()
         assert search_api_client.index.called
 
     @mock.patch('app.service_utils.search_api_client')
@@ -862,6 +896,7 @@ class TestDraftServices(BaseApplicationTest):
             'An example G-7 SCS Service')
 
         # service should not be indexed as G-Cloud 7 is not live
+        self.send_search_index_updates()
         assert not search_api_client.index.called
 
     def create_draft_service(self):
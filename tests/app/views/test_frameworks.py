@@ -1,13 +1,14 @@
 import datetime
 
 from flask import json
-from nose.tools import assert_equal, assert_in
+from nose.tools import assert_equal, assert_in, assert_not_in
 from dateutil.parser import parse as parse_time
 
 from dmutils.audit import AuditTypes
 
 from ..helpers import BaseApplicationTest
-from app.models import db, Framework, SupplierFramework, DraftService, AuditEvent, Supplier, User
+from app.models import db, Framework, FrameworkStats, SupplierFramework, DraftService, AuditEvent, Supplier, User
+from app.framework_utils import refresh_framework_stats
 
 
 class TestListFrameworks(BaseApplicationTest):
@@ -51,6 +52,12 @@ class TestGetFramework(BaseApplicationTest):
 
             assert_equal(response.status_code, 404)
 
+    def test_a_304_is_returned_if_not_modified(self):
+        etag = self.client.get('/frameworks/g-cloud-7').headers['ETag']
+
+        response = self.client.get('/frameworks/g-cloud-7', headers={'If-None-Match': etag})
+        assert_equal(response.status_code, 304)
+
 
 class TestUpdateFramework(BaseApplicationTest):
     def setup(self):
@@ -80,6 +87,20 @@ class TestUpdateFramework(BaseApplicationTest):
             assert response.status_code == 200
             assert Framework.query.filter(Framework.slug == 'example').first().status == "expired"
 
+    def test_framework_update_invalidates_cached_frameworks(self):
+        self.app.config['DM_FRAMEWORK_REGISTRY_TTL'] = 3600
+        with self.app.app_context():
+            response = self.client.get('/frameworks/example')
+            assert_equal(json.loads(response.get_data())['frameworks']['status'], 'open')
+
+            self.client.post('/frameworks/example',
+                             data=json.dumps({'frameworks': {'status': 'expired'},
+                                              'updated_by': 'example user'}),
+                             content_type="application/json")
+
+            response = self.client.get('/frameworks/example')
+            assert_equal(json.loads(response.get_data())['frameworks']['status'], 'expired')
+
     def test_returns_404_on_non_existent_framework(self):
         with self.app.app_context():
             response = self.client.post('/frameworks/example2',
@@ -279,6 +300,63 @@ class TestFrameworkStats(BaseApplicationTest):
             ]
         })
 
+    def test_stats_are_cached_for_the_ttl(self):
+        self.app.config['DM_FRAMEWORK_STATS_TTL'] = 60
+        self.setup_data('g-cloud-7')
+
+        response = self.client.get('/frameworks/g-cloud-7/stats')
+        supplier_users = json.loads(response.get_data())['supplier_users']
+        self.create_users([12], logged_in_at=datetime.datetime.utcnow())
+
+        response = self.client.get('/frameworks/g-cloud-7/stats')
+        assert_equal(response.status_code, 200)
+        assert_equal(supplier_users, json.loads(response.get_data())['supplier_users'])
+
+    def test_background_stats_are_read_from_the_last_refresh(self):
+        self.app.config['DM_FRAMEWORK_STATS_REFRESH'] = 'background'
+        self.setup_data('g-cloud-7')
+
+        response = self.client.get('/frameworks/g-cloud-7/stats')
+        assert_equal(response.status_code, 503)
+
+        with self.app.app_context():
+            self.set_framework_status('g-cloud-7', 'open')
+            assert_in('g-cloud-7', refresh_framework_stats())
+        self.create_users([12], logged_in_at=datetime.datetime.utcnow())
+
+        response = self.client.get('/frameworks/g-cloud-7/stats')
+        assert_equal(response.status_code, 200)
+        assert_in(
+            {u'count': 5, u'recent_login': True},
+            json.loads(response.get_data())['supplier_users']
+        )
+
+        with self.app.app_context():
+            assert_in('g-cloud-7', refresh_framework_stats())
+
+        response = self.client.get('/frameworks/g-cloud-7/stats')
+        assert_in(
+            {u'count': 6, u'recent_login': True},
+            json.loads(response.get_data())['supplier_users']
+        )
+
+
+    def test_background_stats_are_calculated_once_for_frameworks_that_arent_open(self):
+        self.app.config['DM_FRAMEWORK_STATS_REFRESH'] = 'background'
+        self.setup_data('g-cloud-7')
+
+        with self.app.app_context():
+            self.set_framework_status('g-cloud-7', 'live')
+            assert_in('g-cloud-7', refresh_framework_stats())
+            assert_not_in('g-cloud-7', refresh_framework_stats())
+            assert_equal(FrameworkStats.query.count(), Framework.query.count())
+
+        response = self.client.get('/frameworks/g-cloud-7/stats')
+        assert_equal(response.status_code, 200)
+        assert_in(
+            {u'count': 5, u'recent_login': True},
+            json.loads(response.get_data())['supplier_users']
+        )
 
 class TestGetFrameworkSuppliers(BaseApplicationTest):
     def setup(self):
@@ -4,7 +4,8 @@ import os
 from flask import json
 from nose.tools import assert_equal, assert_in, assert_true, \
     assert_almost_equal, assert_false, assert_is_not_none, assert_not_in
-from app.models import Service, Supplier, ContactInformation, Framework
+from app.models import Service, Supplier, ContactInformation, Framework, SerializedService, ArchivedService, \
+    AuditEvent, SearchIndexUpdate
 import mock
 from app import db, create_app
 from ..helpers import BaseApplicationTest, JSONUpdateTestMixin, \
@@ -270,6 +271,204 @@ class TestListServices(BaseApplicationTest):
 
         assert_equal(response.status_code, 404)
 
+    def test_list_services_after_id_first_page(self):
+        self.setup_dummy_services_including_unpublished(7)
+
+        response = self.client.get('/services?after_id=0')
+        data = json.loads(response.get_data())
+
+        assert_equal(response.status_code, 200)
+        assert_equal(len(data['services']), 5)
+        assert_in('after_id=', data['links']['next'])
+        assert_not_in('prev', data['links'])
+        assert_not_in('last', data['links'])
+
+    def test_list_services_after_id_follows_next_link(self):
+        self.setup_dummy_services_including_unpublished(7)
+
+        response = self.client.get('/services?after_id=0')
+        first_page = json.loads(response.get_data())
+
+        # The test client drops the query string from absolute URLs
+        response = self.client.get(first_page['links']['next'].replace('http://localhost', ''))
+        second_page = json.loads(response.get_data())
+
+        assert_equal(response.status_code, 200)
+        assert_equal(len(second_page['services']), 4)
+        assert_not_in('next', second_page['links'])
+        assert_equal(
+            set(s['id'] for s in first_page['services']) & set(s['id'] for s in second_page['services']),
+            set()
+        )
+
+    def test_list_services_after_id_keeps_filters_in_next_link(self):
+        self.setup_dummy_services_including_unpublished(7)
+
+        response = self.client.get('/services?after_id=0&status=published')
+        data = json.loads(response.get_data())
+
+        assert_equal(response.status_code, 200)
+        assert_in('status=published', data['links']['next'])
+
+    def test_list_services_after_id_past_the_end_is_empty(self):
+        self.setup_dummy_services_including_unpublished(7)
+
+        response = self.client.get('/services?after_id=1000000')
+        data = json.loads(response.get_data())
+
+        assert_equal(response.status_code, 200)
+        assert_equal(data['services'], [])
+        assert_equal(data['links'], {})
+
+    def test_invalid_after_id_argument(self):
+        response = self.client.get('/services?after_id=a')
+
+        assert_equal(response.status_code, 400)
+        assert_in(b'Invalid after_id argument', response.get_data())
+
+    def test_after_id_cannot_be_used_with_supplier_id(self):
+        self.setup_dummy_services_including_unpublished(1)
+
+        response = self.client.get('/services?after_id=0&supplier_id=1')
+
+        assert_equal(response.status_code, 400)
+        assert_in(b"after_id can't be used with supplier_id", response.get_data())
+
+    def test_list_services_with_fields(self):
+        self.setup_dummy_services_including_unpublished(1)
+
+        response = self.client.get('/services?fields=serviceName,lot,status,updatedAt')
+        data = json.loads(response.get_data())
+
+        assert_equal(response.status_code, 200)
+        assert_equal(len(data['services']), 3)
+        service = data['services'][0]
+        assert_equal(
+            set(service.keys()),
+            set(['id', 'serviceName', 'lot', 'status', 'updatedAt', 'links'])
+        )
+        assert_equal(service['serviceName'], 'Service {}'.format(service['id']))
+        assert_equal(service['lot'], 'saas')
+        assert_in('/services/{}'.format(service['id']), service['links']['self'])
+        datetime.strptime(service['updatedAt'], DATETIME_FORMAT)
+
+    def test_list_services_with_fields_matches_full_services(self):
+        self.setup_dummy_services_including_unpublished(3)
+
+        full = json.loads(self.client.get('/services?status=published').get_data())
+        sparse = json.loads(self.client.get(
+            '/services?status=published&fields=supplierName,frameworkSlug,createdAt'
+        ).get_data())
+
+        assert_equal(
+            [(s['id'], s['supplierName'], s['frameworkSlug'], s['createdAt']) for s in full['services']],
+            [(s['id'], s['supplierName'], s['frameworkSlug'], s['createdAt']) for s in sparse['services']]
+        )
+
+    def test_list_services_with_fields_leaves_out_missing_keys(self):
+        self.setup_dummy_services_including_unpublished(1)
+
+        response = self.client.get('/services?fields=notAField')
+        data = json.loads(response.get_data())
+
+        assert_equal(response.status_code, 200)
+        assert_equal(set(data['services'][0].keys()), set(['id', 'links']))
+
+    def test_list_services_with_fields_and_after_id(self):
+        self.setup_dummy_services_including_unpublished(7)
+
+        response = self.client.get('/services?after_id=0&fields=serviceName')
+        data = json.loads(response.get_data())
+
+        assert_equal(response.status_code, 200)
+        assert_equal(len(data['services']), 5)
+        assert_in('fields=serviceName', data['links']['next'])
+
+    def test_list_services_with_fields_by_supplier(self):
+        self.setup_dummy_services_including_unpublished(4)
+
+        response = self.client.get('/services?supplier_id=1&fields=serviceName')
+        data = json.loads(response.get_data())
+
+        assert_equal(response.status_code, 200)
+        assert_equal(len(data['services']), 3)
+
+    def test_invalid_fields_argument(self):
+        response = self.client.get('/services?fields=serviceName,not-a-key')
+
+        assert_equal(response.status_code, 400)
+        assert_in(b'Invalid fields argument', response.get_data())
+
+    def setup_services_with_data(self):
+        self.setup_dummy_suppliers(1)
+        with self.app.app_context():
+            self.setup_dummy_service('2000000001', supplier_id=0, lot_id=1, data={
+                'serviceName': 'Hosting', 'serviceTypes': ['Hosting', 'Storage'], 'openSource': True})
+            self.setup_dummy_service('2000000002', supplier_id=0, lot_id=1, data={
+                'serviceName': 'Storage', 'serviceTypes': ['Storage'], 'openSource': False})
+            self.setup_dummy_service('2000000003', supplier_id=0, lot_id=3, data={
+                'serviceName': 'Compute', 'serviceTypes': ['Compute'], 'openSource': True})
+            db.session.commit()
+
+    def get_filtered_service_ids(self, query_string):
+        response = self.client.get('/services?{}'.format(query_string))
+        assert_equal(response.status_code, 200)
+        return [service['id'] for service in json.loads(response.get_data())['services']]
+
+    def test_filter_by_list_value(self):
+        self.setup_services_with_data()
+
+        assert_equal(self.get_filtered_service_ids('filter[serviceTypes]=Storage'), ['2000000001', '2000000002'])
+
+    def test_filter_by_string_value(self):
+        self.setup_services_with_data()
+
+        assert_equal(self.get_filtered_service_ids('filter[serviceName]=Compute'), ['2000000003'])
+
+    def test_filter_by_boolean_value(self):
+        self.setup_services_with_data()
+
+        assert_equal(self.get_filtered_service_ids('filter[openSource]=false'), ['2000000002'])
+
+    def test_filter_by_lot(self):
+        self.setup_services_with_data()
+
+        assert_equal(self.get_filtered_service_ids('filter[lot]=iaas'), ['2000000003'])
+
+    def test_filters_are_combined(self):
+        self.setup_services_with_data()
+
+        assert_equal(
+            self.get_filtered_service_ids('filter[serviceTypes]=Hosting&filter[serviceTypes]=Storage'),
+            ['2000000001'])
+        assert_equal(
+            self.get_filtered_service_ids('filter[openSource]=true&filter[lot]=saas'),
+            ['2000000001'])
+
+    def test_filters_are_kept_in_next_links(self):
+        self.setup_services_with_data()
+        with self.app.app_context():
+            self.setup_dummy_service('2000000004', supplier_id=0, lot_id=1, data={
+                'serviceName': 'Storage', 'serviceTypes': ['Storage', 'Hosting'], 'openSource': True})
+            db.session.commit()
+        self.app.config['DM_API_SERVICES_PAGE_SIZE'] = 1
+
+        for first_page in ['page=1', 'after_id=0']:
+            url = '/services?filter[serviceTypes]=Storage&filter[serviceTypes]=Hosting&{}'.format(first_page)
+            service_ids = []
+            while url:
+                data = json.loads(self.client.get(url).get_data())
+                service_ids.extend(service['id'] for service in data['services'])
+                url = data['links'].get('next', '').replace('http://localhost', '')
+
+            assert_equal(sorted(service_ids), ['2000000001', '2000000004'])
+
+    def test_invalid_filter_argument(self):
+        response = self.client.get('/services?filter[service-types]=Storage')
+
+        assert_equal(response.status_code, 400)
+        assert_in(b'Invalid filter argument', response.get_data())
+
     def test_below_one_page_number_is_404(self):
         response = self.client.get('/services?page=0')
 
@@ -350,6 +549,161 @@ class TestListServices(BaseApplicationTest):
 
         assert_equal(response.status_code, 404)
 
+    def test_supplier_services_page_is_ordered_summary(self):
+        self.setup_services_with_data()
+
+        response = self.client.get('/services?supplier_id=0&summary=true&page=1')
+        data = json.loads(response.get_data())
+
+        assert_equal(response.status_code, 200)
+        assert_equal([service['id'] for service in data['services']], ['2000000001', '2000000002', '2000000003'])
+        assert_equal(set(data['services'][0].keys()), set([
+            'id', 'serviceName', 'frameworkSlug', 'frameworkName', 'lot', 'lotName', 'status', 'updatedAt', 'links'
+        ]))
+        assert_equal(data['services'][0]['serviceName'], 'Hosting')
+        assert_equal(data['links'], {})
+
+    def test_supplier_services_page_with_fields(self):
+        self.setup_services_with_data()
+
+        response = self.client.get('/services?supplier_id=0&summary=true&page=1&fields=serviceName')
+        data = json.loads(response.get_data())
+
+        assert_equal(response.status_code, 200)
+        assert_equal(set(data['services'][0].keys()), set(['id', 'serviceName', 'links']))
+
+    def test_supplier_services_page_is_filtered(self):
+        self.setup_services_with_data()
+
+        assert_equal(
+            self.get_filtered_service_ids('supplier_id=0&summary=true&page=1&filter[serviceTypes]=Storage'),
+            ['2000000001', '2000000002']
+        )
+
+    def test_supplier_services_pages_have_prev_and_next_links(self):
+        self.setup_dummy_services_including_unpublished(21)
+
+        response = self.client.get('/services?supplier_id=1&summary=true&page=1')
+        data = json.loads(response.get_data())
+
+        assert_equal(len(data['services']), 5)
+        assert_in('page=2', data['links']['next'])
+        assert_not_in('prev', data['links'])
+        assert_not_in('last', data['links'])
+
+        response = self.client.get('/services?supplier_id=1&summary=true&page=2')
+        data = json.loads(response.get_data())
+
+        assert_equal(len(data['services']), 2)
+        assert_in('page=1', data['links']['prev'])
+        assert_not_in('next', data['links'])
+
+    def test_supplier_services_page_for_supplier_with_no_services(self):
+        self.setup_dummy_services_including_unpublished(15)
+
+        response = self.client.get('/services?supplier_id=%d&summary=true&page=1' % TEST_SUPPLIERS_COUNT)
+        data = json.loads(response.get_data())
+
+        assert_equal(response.status_code, 200)
+        assert_equal(data['services'], [])
+
+    def test_supplier_services_page_for_unknown_supplier(self):
+        self.setup_dummy_services_including_unpublished(15)
+
+        response = self.client.get('/services?supplier_id=100&summary=true&page=1')
+
+        assert_equal(response.status_code, 404)
+        assert_in(b"supplier_id '100' not found", response.get_data())
+
+    def test_supplier_services_page_without_summary_lists_all_full_services(self):
+        self.setup_dummy_services_including_unpublished(21)
+
+        response = self.client.get('/services?supplier_id=1&page=1')
+        data = json.loads(response.get_data())
+
+        assert_equal(response.status_code, 200)
+        assert_equal(len(data['services']), 7)
+        assert_in('supplierName', data['services'][0])
+        assert_equal(data['links'], {})
+
+    def test_summary_needs_supplier_id(self):
+        response = self.client.get('/services?summary=true')
+
+        assert_equal(response.status_code, 400)
+        assert_in(b"summary can only be used with supplier_id", response.get_data())
+
+    def test_invalid_summary_argument(self):
+        response = self.client.get('/services?supplier_id=1&summary=maybe')
+
+        assert_equal(response.status_code, 400)
+        assert_in(b"Invalid summary argument", response.get_data())
+
+    def test_supplier_services_page_must_be_positive(self):
+        response = self.client.get('/services?supplier_id=1&summary=true&page=0')
+
+        assert_equal(response.status_code, 400)
+
+
+class TestExportServices(BaseApplicationTest):
+    def get_exported_services(self, url='/services/export'):
+        response = self.client.get(url)
+        assert_equal(response.status_code, 200)
+        return [json.loads(line) for line in response.get_data().splitlines()]
+
+    def test_export_with_no_services(self):
+        assert_equal(self.get_exported_services(), [])
+
+    def test_export_is_newline_delimited_json(self):
+        self.setup_dummy_services_including_unpublished(3)
+
+        response = self.client.get('/services/export')
+
+        assert_equal(response.status_code, 200)
+        assert_equal(response.mimetype, 'application/x-ndjson')
+        assert_equal(len(response.get_data().splitlines()), 5)
+
+    def test_export_returns_all_services_in_id_order(self):
+        self.app.config['DM_API_SERVICES_EXPORT_BATCH_SIZE'] = 2
+        self.setup_dummy_services_including_unpublished(7)
+
+        services = self.get_exported_services()
+
+        assert_equal(len(services), 9)
+        assert_equal([s['id'] for s in services], sorted(s['id'] for s in services))
+
+    def test_exported_service_matches_serialized_service(self):
+        self.setup_dummy_services_including_unpublished(1)
+
+        exported = self.get_exported_services()[0]
+        response = self.client.get('/services/{}'.format(exported['id']))
+
+        assert_equal(exported, json.loads(response.get_data())['services'])
+
+    def test_export_filters_by_status(self):
+        self.setup_dummy_services_including_unpublished(3)
+
+        services = self.get_exported_services('/services/export?status=enabled,disabled')
+
+        assert_equal(sorted(s['status'] for s in services), ['disabled', 'enabled'])
+
+    def test_export_only_includes_live_frameworks_by_default(self):
+        with self.app.app_context():
+            self.setup_dummy_service(service_id='2000000999', framework_id=2)
+            self.setup_dummy_services_including_unpublished(1)
+
+        services = self.get_exported_services()
+
+        assert_not_in('2000000999', [s['id'] for s in services])
+
+    def test_export_filters_by_framework(self):
+        with self.app.app_context():
+            self.setup_dummy_service(service_id='2000000999', framework_id=2)
+            self.setup_dummy_services_including_unpublished(1)
+
+        services = self.get_exported_services('/services/export?framework=g-cloud-4')
+
+        assert_equal([s['id'] for s in services], ['2000000999'])
+
 
 class TestPostService(BaseApplicationTest):
     service_id = None
@@ -711,6 +1065,53 @@ class TestPostService(BaseApplicationTest):
                 self.service_id).get_data()
             assert_equal(len(json.loads(archived_state)['services']), 5)
 
+    def test_updated_service_links_to_its_latest_archived_service(self):
+        with self.app.app_context():
+            for i in range(3):
+                response = self.client.post(
+                    '/services/%s' % self.service_id,
+                    data=json.dumps(
+                        {'update_details': {
+                            'updated_by': 'joeblogs'},
+                         'services': {
+                             'serviceName': 'new service name' + str(i)}}),
+                    content_type='application/json')
+
+                assert_equal(response.status_code, 200)
+
+            archived_ids = [archived_service.id for archived_service in ArchivedService.query.filter(
+                ArchivedService.service_id == self.service_id
+            ).order_by(ArchivedService.id)]
+            service = Service.query.filter(Service.service_id == self.service_id).first()
+            audit_event = AuditEvent.query.filter(
+                AuditEvent.type == 'update_service'
+            ).order_by(AuditEvent.id.desc()).first()
+
+            assert_equal(service.latest_archived_service_id, archived_ids[-1])
+            assert_equal(audit_event.data['oldArchivedServiceId'], archived_ids[-2])
+            assert_equal(audit_event.data['newArchivedServiceId'], archived_ids[-1])
+
+    def test_updated_service_and_its_latest_archived_service_have_the_same_updated_at(self):
+        with self.app.app_context():
+            for url, data in [
+                ('/services/%s' % self.service_id, {'serviceName': 'new service name'}),
+                ('/services/%s/status/enabled' % self.service_id, None),
+            ]:
+                response = self.client.post(
+                    url,
+                    data=json.dumps(
+                        {'update_details': {
+                            'updated_by': 'joeblogs'},
+                         'services': data}),
+                    content_type='application/json')
+
+                assert_equal(response.status_code, 200)
+
+                service = Service.query.filter(Service.service_id == self.service_id).first()
+                archived_service = ArchivedService.query.get(service.latest_archived_service_id)
+
+                assert_equal(service.updated_at, archived_service.updated_at)
+
     def test_writing_full_service_back(self):
         with self.app.app_context():
             response = self.client.get('/services/%s' % self.service_id)
@@ -957,6 +1358,292 @@ class TestPostService(BaseApplicationTest):
             assert_equal(response.status_code, 200)
 
 
+@mock.patch('app.service_utils.search_api_client')
+class TestSerializedServices(BaseApplicationTest):
+    def setup(self):
+        super(TestSerializedServices, self).setup()
+        payload = self.load_example_listing("G6-IaaS")
+        self.service_id = str(payload['id'])
+        with self.app.app_context():
+            db.session.add(
+                Supplier(supplier_id=1, name=u"Supplier 1")
+            )
+            db.session.commit()
+
+        self.client.put(
+            '/services/%s' % self.service_id,
+            data=json.dumps(
+                {'update_details': {
+                    'updated_by': 'joeblogs'},
+                 'services': payload}),
+            content_type='application/json')
+
+    def get_service(self):
+        response = self.client.get('/services/%s' % self.service_id)
+        assert_equal(response.status_code, 200)
+        return json.loads(response.get_data())['services']
+
+    def get_serialized_service(self):
+        return SerializedService.query.join(
+            Service, Service.id == SerializedService.id
+        ).filter(
+            Service.service_id == self.service_id
+        ).first()
+
+    def replace_cached_service_name(self, name):
+        serialized = self.get_serialized_service()
+        serialized.data = dict(serialized.data, serviceName=name)
+        db.session.add(serialized)
+        db.session.commit()
+
+    def test_import_caches_serialized_service(self, search_api_client):
+        with self.app.test_request_context():
+            serialized = self.get_serialized_service()
+            service = Service.query.filter(Service.service_id == self.service_id).first()
+
+            assert_equal(serialized.updated_at, service.updated_at)
+            assert_equal(SerializedService.add_links(serialized.data), service.serialize())
+
+    def test_update_rebuilds_serialized_service(self, search_api_client):
+        self.client.post(
+            '/services/%s' % self.service_id,
+            data=json.dumps(
+                {'update_details': {
+                    'updated_by': 'joeblogs'},
+                 'services': {
+                     'serviceName': 'new service name'}}),
+            content_type='application/json')
+
+        with self.app.app_context():
+            assert_equal(self.get_serialized_service().data['serviceName'], 'new service name')
+
+    def test_status_update_rebuilds_serialized_service(self, search_api_client):
+        self.client.post(
+            '/services/%s/status/disabled' % self.service_id,
+            data=json.dumps(
+                {'update_details': {
+                    'updated_by': 'joeblogs'}}),
+            content_type='application/json')
+
+        with self.app.app_context():
+            assert_equal(self.get_serialized_service().data['status'], 'disabled')
+
+    def test_get_service_uses_current_serialized_service(self, search_api_client):
+        with self.app.app_context():
+            self.replace_cached_service_name('cached service name')
+
+        assert_equal(self.get_service()['serviceName'], 'cached service name')
+
+    def test_list_services_uses_current_serialized_service(self, search_api_client):
+        with self.app.app_context():
+            self.replace_cached_service_name('cached service name')
+
+        response = self.client.get('/services')
+        data = json.loads(response.get_data())
+
+        assert_equal(data['services'][0]['serviceName'], 'cached service name')
+        assert_equal(data['services'][0]['links'], self.get_service()['links'])
+
+    def test_stale_serialized_service_is_not_used(self, search_api_client):
+        with self.app.app_context():
+            self.replace_cached_service_name('cached service name')
+            service = Service.query.filter(Service.service_id == self.service_id).first()
+            service.updated_at = datetime.utcnow()
+            db.session.add(service)
+            db.session.commit()
+
+        assert_equal(self.get_service()['serviceName'], 'My Iaas Service')
+
+    def test_services_without_serialized_service_are_serialized(self, search_api_client):
+        with self.app.app_context():
+            SerializedService.query.delete()
+            db.session.commit()
+
+        assert_equal(self.get_service()['serviceName'], 'My Iaas Service')
+
+    def test_supplier_update_invalidates_serialized_services(self, search_api_client):
+        self.client.post(
+            '/suppliers/1',
+            data=json.dumps({
+                'suppliers': {'name': 'New Name'},
+                'updated_by': 'supplier@user.dmdev',
+            }),
+            content_type='application/json')
+
+        with self.app.app_context():
+            assert_equal(self.get_serialized_service(), None)
+
+        assert_equal(self.get_service()['supplierName'], 'New Name')
+
+    def test_framework_update_invalidates_serialized_services(self, search_api_client):
+        def update_framework_status(status):
+            return self.client.post(
+                '/frameworks/g-cloud-6',
+                data=json.dumps({'frameworks': {'status': status}, 'updated_by': 'example user'}),
+                content_type='application/json')
+
+        try:
+            update_framework_status('expired')
+
+            with self.app.app_context():
+                assert_equal(self.get_serialized_service(), None)
+
+            assert_equal(self.get_service()['frameworkStatus'], 'expired')
+        finally:
+            update_framework_status('live')
+
+
+@mock.patch('app.service_utils.search_api_client')
+class TestImportServices(BaseApplicationTest):
+    def setup(self):
+        super(TestImportServices, self).setup()
+        with self.app.app_context():
+            db.session.add(
+                Supplier(supplier_id=1, name=u"Supplier 1")
+            )
+            db.session.commit()
+
+    def load_services(self, count):
+        services = []
+        for i in range(count):
+            payload = self.load_example_listing("G6-IaaS")
+            payload['id'] = str(1234567890123456 + i)
+            services.append(payload)
+        return services
+
+    def import_services(self, services):
+        return self.client.put(
+            '/services',
+            data=json.dumps({
+                'update_details': {'updated_by': 'joeblogs'},
+                'services': services,
+            }),
+            content_type='application/json')
+
+    def test_import_creates_all_services(self, search_api_client):
+        services = self.load_services(3)
+
+        response = self.import_services(services)
+
+        assert_equal(response.status_code, 201)
+        assert_equal(json.loads(response.get_data())['services'], [
+            {'id': service['id'], 'result': 'created'} for service in services
+        ])
+        for service in services:
+            response = self.client.get('/services/{}'.format(service['id']))
+            assert_equal(response.status_code, 200)
+            assert_equal(json.loads(response.get_data())['services']['serviceName'], 'My Iaas Service')
+
+    def test_import_archives_and_audits_each_service(self, search_api_client):
+        self.import_services(self.load_services(2))
+
+        with self.app.app_context():
+            archived_services = ArchivedService.query.order_by(ArchivedService.id).all()
+            audit_events = AuditEvent.query.filter(AuditEvent.type == 'import_service').all()
+
+            assert_equal(len(archived_services), 2)
+            assert_equal(len(audit_events), 2)
+            for audit_event in audit_events:
+                assert_equal(audit_event.user, 'joeblogs')
+                assert_equal(audit_event.object.service_id, audit_event.data['serviceId'])
+                assert_equal(audit_event.data['oldArchivedServiceId'], None)
+                assert_in(audit_event.data['newArchivedServiceId'], [a.id for a in archived_services])
+                assert_equal(audit_event.object.latest_archived_service_id, audit_event.data['newArchivedServiceId'])
+
+    def test_import_caches_serialized_services(self, search_api_client):
+        self.import_services(self.load_services(2))
+
+        with self.app.app_context():
+            assert_equal(SerializedService.query.count(), 2)
+
+    def test_import_indexes_services(self, search_api_client):
+        services = self.load_services(2)
+
+        self.import_services(services)
+        self.send_search_index_updates()
+
+        assert_equal(
+            [call[0][0] for call in search_api_client.index.call_args_list],
+            [service['id'] for service in services]
+        )
+
+    def test_import_reports_invalid_services_and_creates_the_rest(self, search_api_client):
+        services = self.load_services(5)
+        services[0]['frameworkSlug'] = 'not-a-framework'
+        services[1]['lot'] = 'saas-ish'
+        services[2]['supplierId'] = 999
+        services[3]['serviceName'] = ''
+
+        response = self.import_services(services)
+        results = json.loads(response.get_data())['services']
+
+        assert_equal(response.status_code, 201)
+        assert_equal([result['result'] for result in results], ['error', 'error', 'error', 'error', 'created'])
+        assert_in("Framework 'not-a-framework' does not exist", results[0]['error'])
+        assert_in("Incorrect lot 'saas-ish'", results[1]['error'])
+        assert_in("Invalid supplier_id '999'", results[2]['error'])
+        assert_equal(results[3]['error'], {'serviceName': 'answer_required'})
+        with self.app.app_context():
+            assert_equal(Service.query.count(), 1)
+
+    def test_import_reports_invalid_dates_and_creates_the_rest(self, search_api_client):
+        services = self.load_services(3)
+        services[0]['createdAt'] = 'not a date'
+        services[1]['updatedAt'] = '2015-02-30T10:00:00Z'
+
+        response = self.import_services(services)
+        results = json.loads(response.get_data())['services']
+
+        assert_equal(response.status_code, 201)
+        assert_equal([result['result'] for result in results], ['error', 'error', 'created'])
+        assert_equal(results[0]['error'], "Invalid createdAt 'not a date'")
+        assert_equal(results[1]['error'], "Invalid updatedAt '2015-02-30T10:00:00Z'")
+        with self.app.app_context():
+            service = Service.query.one()
+            assert_equal(service.created_at, datetime(2014, 12, 23, 14, 46, 22))
+
+    def test_import_does_not_replace_existing_services(self, search_api_client):
+        services = self.load_services(2)
+        self.import_services(services[:1])
+
+        response = self.import_services(services)
+        results = json.loads(response.get_data())['services']
+
+        assert_equal(results[0]['error'], 'Cannot update service by PUT')
+        assert_equal(results[1]['result'], 'created')
+
+    def test_import_rejects_duplicate_service_ids(self, search_api_client):
+        services = self.load_services(1) * 2
+
+        response = self.import_services(services)
+        results = json.loads(response.get_data())['services']
+
+        assert_equal([result['result'] for result in results], ['created', 'error'])
+
+    def test_import_with_no_valid_services_is_400(self, search_api_client):
+        services = self.load_services(1)
+        services[0]['id'] = 'invalid id'
+
+        response = self.import_services(services)
+
+        assert_equal(response.status_code, 400)
+        assert_in('Invalid service ID supplied', json.loads(response.get_data())['services'][0]['error'])
+
+    def test_import_services_must_be_a_list(self, search_api_client):
+        response = self.import_services(self.load_services(1)[0])
+
+        assert_equal(response.status_code, 400)
+        assert_in(b"'services' must be a list", response.get_data())
+
+    def test_import_limits_number_of_services(self, search_api_client):
+        self.app.config['DM_API_SERVICES_IMPORT_BATCH_SIZE'] = 2
+
+        response = self.import_services(self.load_services(3))
+
+        assert_equal(response.status_code, 400)
+        assert_in(b'Too many services', response.get_data())
+
+
 @mock.patch('app.service_utils.search_api_client')
 class TestShouldCallSearchApiOnPutToCreateService(BaseApplicationTest):
     def setup(self):
@@ -983,6 +1670,7 @@ class TestShouldCallSearchApiOnPutToCreateService(BaseApplicationTest):
                         'services': payload}
                 ),
                 content_type='application/json')
+            self.send_search_index_updates()
 
             search_api_client.index.assert_called_with(
                 "1234567890123456",
@@ -1009,6 +1697,8 @@ class TestShouldCallSearchApiOnPutToCreateService(BaseApplicationTest):
             assert_equal(res.status_code, 201)
             assert_is_not_none(Service.query.filter(
                 Service.service_id == payload["id"]).first())
+            assert_equal(SearchIndexUpdate.query.count(), 0)
+            self.send_search_index_updates()
             assert_false(search_api_client.index.called)
 
     def test_should_ignore_index_error_on_service_put(self, search_api_client):
@@ -1028,6 +1718,8 @@ class TestShouldCallSearchApiOnPutToCreateService(BaseApplicationTest):
                 content_type='application/json')
 
             assert_equal(response.status_code, 201)
+            self.send_search_index_updates()
+            assert_equal(SearchIndexUpdate.query.one().attempts, 1)
 
 
 @mock.patch('app.service_utils.search_api_client')
@@ -1074,6 +1766,7 @@ class TestShouldCallSearchApiOnPost(BaseApplicationTest):
                         'services': payload}
                 ),
                 content_type='application/json')
+            self.send_search_index_updates()
 
             search_api_client.index.assert_called_with(
                 "1234567890123456",
@@ -1082,7 +1775,7 @@ class TestShouldCallSearchApiOnPost(BaseApplicationTest):
 
     @mock.patch('app.service_utils.db.session.commit')
     def test_should_not_index_on_service_post_if_db_exception(
-            self, search_api_client, db_session_commit
+            self, db_session_commit, search_api_client
     ):
         with self.app.app_context():
             search_api_client.index.return_value = True
@@ -1100,6 +1793,7 @@ class TestShouldCallSearchApiOnPost(BaseApplicationTest):
                         'services': payload}
                 ),
                 content_type='application/json')
+            assert_equal(SearchIndexUpdate.query.count(), 0)
             assert_equal(search_api_client.index.called, False)
 
     def test_should_not_index_on_service_on_expired_frameworks(
@@ -1120,6 +1814,7 @@ class TestShouldCallSearchApiOnPost(BaseApplicationTest):
                 content_type='application/json')
 
             assert_equal(res.status_code, 200)
+            self.send_search_index_updates()
             assert_false(search_api_client.index.called)
 
     def test_should_ignore_index_error(self, search_api_client):
@@ -1219,6 +1914,8 @@ class TestShouldCallSearchApiOnPostStatusUpdate(BaseApplicationTest):
             # Check that service in database has been updated
             assert_equal(new_status, service.status)
 
+            self.send_search_index_updates()
+
             # Check that search_api_client is doing the right thing
             if service_is_indexed:
                 search_api_client.index.assert_called_with(
@@ -1309,6 +2006,97 @@ class TestShouldCallSearchApiOnPostStatusUpdate(BaseApplicationTest):
         assert_equal(response.status_code, 200)
 
 
+@mock.patch('app.service_utils.search_api_client')
+class TestSendSearchIndexUpdates(BaseApplicationTest):
+    def setup(self):
+        super(TestSendSearchIndexUpdates, self).setup()
+        with self.app.app_context():
+            db.session.add(
+                Supplier(supplier_id=1, name=u"Supplier 1")
+            )
+            self.setup_dummy_service('1234567890123456')
+            self.setup_dummy_service('1234567890123457', status='enabled')
+            db.session.commit()
+
+    def queue_update(self, service_id, action, **kwargs):
+        with self.app.app_context():
+            db.session.add(SearchIndexUpdate(service_id=service_id, action=action, **kwargs))
+            db.session.commit()
+
+    def test_sends_index_update_and_removes_it(self, search_api_client):
+        self.queue_update('1234567890123456', 'index')
+
+        assert_equal(self.send_search_index_updates(), 1)
+
+        search_api_client.index.assert_called_once_with('1234567890123456', mock.ANY)
+        with self.app.app_context():
+            assert_equal(SearchIndexUpdate.query.count(), 0)
+
+    def test_only_latest_update_for_a_service_is_sent(self, search_api_client):
+        self.queue_update('1234567890123456', 'index')
+        self.queue_update('1234567890123456', 'delete')
+
+        assert_equal(self.send_search_index_updates(), 1)
+
+        assert_false(search_api_client.index.called)
+        search_api_client.delete.assert_called_once_with('1234567890123456')
+        with self.app.app_context():
+            assert_equal(SearchIndexUpdate.query.count(), 0)
+
+    def test_index_update_is_skipped_if_service_is_no_longer_published(self, search_api_client):
+        self.queue_update('1234567890123457', 'index')
+
+        self.send_search_index_updates()
+
+        assert_false(search_api_client.index.called)
+        with self.app.app_context():
+            assert_equal(SearchIndexUpdate.query.count(), 0)
+
+    def test_delete_of_service_missing_from_index_is_not_an_error(self, search_api_client):
+        search_api_client.delete.side_effect = HTTPError(mock.Mock(status_code=404))
+        self.queue_update('1234567890123456', 'delete')
+
+        self.send_search_index_updates()
+
+        with self.app.app_context():
+            assert_equal(SearchIndexUpdate.query.count(), 0)
+
+    def test_failed_update_is_retried_after_a_delay(self, search_api_client):
+        search_api_client.index.side_effect = HTTPError()
+        self.queue_update('1234567890123456', 'index')
+
+        self.send_search_index_updates()
+        self.send_search_index_updates()
+
+        assert_equal(search_api_client.index.call_count, 1)
+        with self.app.app_context():
+            update = SearchIndexUpdate.query.one()
+            assert_equal(update.attempts, 1)
+            assert_true(update.next_attempt_at > datetime.utcnow())
+            assert_is_not_none(update.last_error)
+
+    def test_failed_update_is_not_retried_after_max_attempts(self, search_api_client):
+        self.queue_update('1234567890123456', 'index',
+                          attempts=self.app.config['DM_SEARCH_INDEX_MAX_ATTEMPTS'])
+
+        assert_equal(self.send_search_index_updates(), 0)
+
+        assert_false(search_api_client.index.called)
+        with self.app.app_context():
+            assert_equal(SearchIndexUpdate.query.count(), 1)
+
+    def test_new_update_supersedes_a_failed_one(self, search_api_client):
+        self.queue_update('1234567890123456', 'index',
+                          attempts=self.app.config['DM_SEARCH_INDEX_MAX_ATTEMPTS'])
+        self.queue_update('1234567890123456', 'delete')
+
+        self.send_search_index_updates()
+
+        search_api_client.delete.assert_called_once_with('1234567890123456')
+        with self.app.app_context():
+            assert_equal(SearchIndexUpdate.query.count(), 0)
+
+
 class TestPutService(BaseApplicationTest, JSONUpdateTestMixin):
     method = "put"
     endpoint = "/services/1234567890123456"
@@ -1400,6 +2188,31 @@ class TestPutService(BaseApplicationTest, JSONUpdateTestMixin):
                 now,
                 delta=timedelta(seconds=2))
 
+    @mock.patch('app.search_api_client')
+    def test_import_keeps_updated_at_on_the_service_and_its_archived_service(self, search_api_client):
+        with self.app.app_context():
+            payload = self.load_example_listing("G6-IaaS")
+            payload['id'] = "1234567890123456"
+            payload['updatedAt'] = "2015-01-05T10:00:00Z"
+            response = self.client.put(
+                '/services/1234567890123456',
+                data=json.dumps({
+                    'update_details': {
+                        'updated_by': 'joeblogs'},
+                    'services': payload,
+                }),
+                content_type='application/json')
+
+            assert_equal(response.status_code, 201)
+
+            service = Service.query.filter(
+                Service.service_id == "1234567890123456"
+            ).first()
+            archived_service = ArchivedService.query.get(service.latest_archived_service_id)
+
+            assert_equal(service.updated_at, datetime(2015, 1, 5, 10, 0, 0))
+            assert_equal(archived_service.updated_at, service.updated_at)
+
     @mock.patch('app.search_api_client')
     def test_whitespace_is_stripped_on_import(self, search_api_client):
         with self.app.app_context():
@@ -1739,6 +2552,23 @@ class TestGetService(BaseApplicationTest):
         assert_equal(200, response.status_code)
         assert_equal("123-enabled-456", data['services']['id'])
 
+    def test_get_service_returns_304_if_not_modified(self):
+        etag = self.client.get('/services/123-published-456').headers['ETag']
+
+        response = self.client.get('/services/123-published-456', headers={'If-None-Match': etag})
+        assert_equal(304, response.status_code)
+
+    def test_get_service_etag_changes_when_service_is_updated(self):
+        etag = self.client.get('/services/123-published-456').headers['ETag']
+        with self.app.app_context():
+            service = Service.query.filter(Service.service_id == '123-published-456').first()
+            service.update_from_json({'foo': 'baz'})
+            db.session.commit()
+
+        response = self.client.get('/services/123-published-456', headers={'If-None-Match': etag})
+        assert_equal(200, response.status_code)
+        assert_true(response.headers['ETag'] != etag)
+
     def test_get_service_returns_supplier_info(self):
         response = self.client.get('/services/123-published-456')
         data = json.loads(response.get_data())
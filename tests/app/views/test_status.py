@@ -1,6 +1,8 @@
+import json
+
 from ..helpers import BaseApplicationTest
 
-from nose.tools import assert_equal
+from nose.tools import assert_equal, assert_in
 
 
 class TestStatus(BaseApplicationTest):
@@ -8,3 +10,12 @@ class TestStatus(BaseApplicationTest):
     def test_should_return_200_from_elb_status_check(self):
         status_response = self.client.get('/_status?ignore-dependencies')
         assert_equal(200, status_response.status_code)
+
+    def test_status_includes_db_pool_counters(self):
+        status_response = self.client.get('/_status')
+        data = json.loads(status_response.get_data())
+
+        assert_equal(200, status_response.status_code)
+        assert_equal(data['db_pool']['mode'], 'queue')
+        assert_in('checkedOut', data['db_pool'])
+        assert_in('waitTime', data['db_pool'])
@@ -6,7 +6,8 @@ from nose.tools import assert_equal, assert_in, assert_is_not_none, assert_true,
 
 from app import db
 from app.models import Supplier, ContactInformation, AuditEvent, \
-    SupplierFramework, Framework, DraftService, Service
+    SupplierFramework, Framework, DraftService, Service, ServiceCount, SupplierLiveFramework
+from app.service_utils import check_service_counts
 from ..helpers import BaseApplicationTest, JSONUpdateTestMixin
 from random import randint
 
@@ -36,6 +37,12 @@ class TestGetSupplier(BaseApplicationTest):
         response = self.client.get('/suppliers/abc123')
         assert_equal(404, response.status_code)
 
+    def test_get_supplier_returns_304_if_not_modified(self):
+        etag = self.client.get('/suppliers/{}'.format(self.supplier_id)).headers['ETag']
+
+        response = self.client.get('/suppliers/{}'.format(self.supplier_id), headers={'If-None-Match': etag})
+        assert_equal(304, response.status_code)
+
     def test_get_supplier(self):
         response = self.client.get('/suppliers/{}'.format(self.supplier_id))
 
@@ -135,6 +142,79 @@ class TestListSuppliers(BaseApplicationTest):
                 data['suppliers'][0]['name']
             )
 
+    def test_prefix_matches_names_case_insensitively(self):
+        with self.app.app_context():
+            db.session.add(Supplier(supplier_id=999, name=u"supplier lower"))
+            db.session.add(Supplier(supplier_id=998, name=u"Acme"))
+            db.session.commit()
+
+        response = self.client.get('/suppliers?prefix=Supplier%20l')
+        data = json.loads(response.get_data())
+
+        assert_equal(200, response.status_code)
+        assert_equal([999], [supplier['id'] for supplier in data['suppliers']])
+
+        response = self.client.get('/suppliers?prefix=a')
+        data = json.loads(response.get_data())
+
+        assert_equal([998], [supplier['id'] for supplier in data['suppliers']])
+
+    def test_supplier_name_initial_follows_name(self):
+        with self.app.app_context():
+            supplier = Supplier(supplier_id=999, name=u"acme")
+            assert_equal(supplier.name_initial, 'A')
+
+            supplier.name = u"3M"
+            assert_equal(supplier.name_initial, Supplier.OTHER_NAME_INITIAL)
+
+    def test_list_supplier_initials(self):
+        with self.app.app_context():
+            db.session.add(Supplier(supplier_id=999, name=u"999 Supplier"))
+            db.session.add(Supplier(supplier_id=998, name=u"acme"))
+            db.session.commit()
+
+        response = self.client.get('/suppliers/initials')
+        data = json.loads(response.get_data())
+
+        assert_equal(200, response.status_code)
+        assert_equal(27, len(data['initials']))
+        assert_equal(7, data['initials']['S'])
+        assert_equal(1, data['initials']['A'])
+        assert_equal(1, data['initials']['other'])
+        assert_equal(0, data['initials']['Z'])
+
+    def test_list_supplier_initials_for_framework(self):
+        with self.app.app_context():
+            self.setup_dummy_service(service_id='1230000000', supplier_id=1)
+            db.session.commit()
+
+        response = self.client.get('/suppliers/initials?framework=gcloud')
+        data = json.loads(response.get_data())
+
+        assert_equal(200, response.status_code)
+        assert_equal(1, data['initials']['S'])
+
+    def test_list_supplier_initials_for_invalid_framework(self):
+        response = self.client.get('/suppliers/initials?framework=not-a-framework')
+
+        assert_equal(400, response.status_code)
+
+    def test_list_suppliers_with_fields(self):
+        response = self.client.get('/suppliers?fields=name')
+        data = json.loads(response.get_data())
+
+        assert_equal(200, response.status_code)
+        assert_equal(5, len(data['suppliers']))
+        assert_equal(set(['id', 'name', 'links']), set(data['suppliers'][0].keys()))
+        assert_equal(u"Supplier 0", data['suppliers'][0]['name'])
+        assert_in('/suppliers/0', data['suppliers'][0]['links']['self'])
+
+    def test_list_suppliers_with_unknown_fields(self):
+        response = self.client.get('/suppliers?fields=name,contactInformation')
+
+        assert_equal(400, response.status_code)
+        assert_in(b"unknown supplier fields 'contactInformation'", response.get_data())
+
     def test_query_string_prefix_returns_paginated_page_one(self):
         response = self.client.get('/suppliers?prefix=s')
         data = json.loads(response.get_data())
@@ -222,6 +302,40 @@ class TestListSuppliersOnFramework(BaseApplicationTest):
         response = self.client.get('/suppliers?framework=bad')
         assert_equal(400, response.status_code)
 
+    def test_supplier_live_frameworks_follow_published_services(self):
+        with self.app.app_context():
+            assert_equal(
+                [(1, 1), (2, 2)],
+                [(row.supplier_id, row.framework_id)
+                 for row in SupplierLiveFramework.query.order_by(SupplierLiveFramework.supplier_id)]
+            )
+
+            Service.query.filter(Service.service_id == '1000000003').first().status = 'published'
+            Service.query.filter(Service.service_id == '1000000001').first().status = 'disabled'
+            db.session.commit()
+
+            assert_equal(
+                [(2, 2), (3, 1)],
+                [(row.supplier_id, row.framework_id)
+                 for row in SupplierLiveFramework.query.order_by(SupplierLiveFramework.supplier_id)]
+            )
+
+        response = self.client.get('/suppliers?framework=gcloud')
+        data = json.loads(response.get_data())
+        assert_equal(['Unpublished Service'], [supplier['name'] for supplier in data['suppliers']])
+
+    def test_supplier_on_several_live_frameworks_is_listed_once(self):
+        with self.app.app_context():
+            db.session.add(Framework(
+                id=101, name='Example', framework='gcloud', slug='example', status='live'
+            ))
+            self.setup_dummy_service(service_id='1000000005', supplier_id=1, framework_id=101)
+            db.session.commit()
+
+        response = self.client.get('/suppliers?framework=gcloud')
+        data = json.loads(response.get_data())
+        assert_equal(['Active'], [supplier['name'] for supplier in data['suppliers']])
+
     def test_should_return_all_suppliers_if_no_framework(self):
         response = self.client.get('/suppliers')
         assert_equal(200, response.status_code)
@@ -1135,6 +1249,75 @@ class TestGetSupplierFrameworks(BaseApplicationTest):
             }
         )
 
+    def test_service_counts_follow_services_and_drafts(self):
+        def service_counts():
+            return [
+                (row.supplier_id, row.lot_id, row.status, row.kind, row.count)
+                for row in ServiceCount.query.order_by(ServiceCount.supplier_id, ServiceCount.lot_id)
+            ]
+
+        with self.app.app_context():
+            assert_equal(
+                [(1, 1, 'not-submitted', 'draft', 1), (1, 2, 'submitted', 'draft', 1),
+                 (2, 2, 'published', 'service', 1)],
+                service_counts()
+            )
+
+            draft = DraftService.query.filter(DraftService.status == 'not-submitted').first()
+            draft.status = 'submitted'
+            db.session.add(draft.copy())
+            db.session.delete(DraftService.query.filter(DraftService.lot_id == 2).first())
+            Service.query.filter(Service.supplier_id == 2).first().status = 'disabled'
+            db.session.commit()
+
+            assert_equal(
+                [(1, 1, 'not-submitted', 'draft', 1), (1, 1, 'submitted', 'draft', 1),
+                 (2, 2, 'disabled', 'service', 1)],
+                service_counts()
+            )
+
+    def test_service_counts_and_live_frameworks_follow_moved_services_and_drafts(self):
+        def service_counts():
+            return [
+                (row.supplier_id, row.lot_id, row.status, row.kind, row.count)
+                for row in ServiceCount.query.order_by(ServiceCount.supplier_id, ServiceCount.lot_id)
+            ]
+
+        def live_frameworks():
+            return [
+                (row.supplier_id, row.framework_id)
+                for row in SupplierLiveFramework.query.order_by(SupplierLiveFramework.supplier_id)
+            ]
+
+        with self.app.app_context():
+            assert_equal([(2, 1)], live_frameworks())
+
+            DraftService.query.filter(DraftService.lot_id == 1).first().lot_id = 2
+            Service.query.filter(Service.supplier_id == 2).first().supplier_id = 3
+            db.session.commit()
+
+            assert_equal(
+                [(1, 2, 'not-submitted', 'draft', 1), (1, 2, 'submitted', 'draft', 1),
+                 (3, 2, 'published', 'service', 1)],
+                service_counts()
+            )
+            assert_equal([(3, 1)], live_frameworks())
+
+    def test_check_service_counts_finds_and_fixes_wrong_counts(self):
+        with self.app.app_context():
+            assert_equal([], check_service_counts())
+
+            db.session.execute(ServiceCount.__table__.update().values(count=5).where(ServiceCount.kind == 'draft'))
+            db.session.execute(ServiceCount.__table__.delete().where(ServiceCount.kind == 'service'))
+            db.session.commit()
+
+            assert_equal([
+                ((1, 1, 1, 'not-submitted', 'draft'), 5, 1),
+                ((1, 1, 2, 'submitted', 'draft'), 5, 1),
+                ((2, 1, 2, 'published', 'service'), 0, 1),
+            ], check_service_counts(fix=True))
+            assert_equal([], check_service_counts())
+
     def test_supplier_that_doesnt_exist(self):
         response = self.client.get('/suppliers/4/frameworks')
         data = json.loads(response.get_data())
@@ -1247,6 +1430,17 @@ class TestRegisterFrameworkInterest(BaseApplicationTest):
             data = json.loads(response2.get_data())
             assert_equal(data['frameworks'], ['digital-outcomes-and-specialists'])
 
+    def test_registered_frameworks_are_ordered_by_framework(self):
+        with self.app.app_context():
+            self.set_framework_status('g-cloud-7', 'open')
+            self.register_interest(1, 'digital-outcomes-and-specialists')
+            self.register_interest(1, 'g-cloud-7')
+
+            response = self.client.get("/suppliers/1/frameworks/interest")
+            assert_equal(response.status_code, 200)
+            data = json.loads(response.get_data())
+            assert_equal(data['frameworks'], ['g-cloud-7', 'digital-outcomes-and-specialists'])
+
 
 class TestSupplierFrameworkUpdates(BaseApplicationTest):
     def setup(self):
@@ -2,13 +2,15 @@ from __future__ import absolute_import
 
 import os
 import json
+import threading
 
 from nose.tools import assert_equal, assert_in, assert_not_in
 from jsonschema import validate, SchemaError, ValidationError
 
 from app.utils import drop_foreign_fields
 from app.validation import validates_against_schema, is_valid_service_id, is_valid_date, \
-    is_valid_acknowledged_state, get_validation_errors, is_valid_string
+    is_valid_acknowledged_state, get_validation_errors, is_valid_string, get_validator, ValidatorCache, \
+    SchemaCache
 
 EXAMPLE_LISTING_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
                                                     '..', 'example_listings'))
@@ -301,6 +303,87 @@ def test_required_fields_param_requires_specified_fields():
     assert "answer_required" in errs['serviceSummary']
 
 
+def test_get_validator_reuses_validators():
+    assert get_validator('services-g-cloud-7-scs') is get_validator('services-g-cloud-7-scs')
+
+
+def test_get_validator_reuses_validators_for_the_same_required_fields_in_any_order():
+    validator = get_validator('services-g-cloud-7-scs', enforce_required=False,
+                              required_fields=['serviceName', 'serviceSummary'])
+
+    assert validator is get_validator('services-g-cloud-7-scs', enforce_required=False,
+                                      required_fields=['serviceSummary', 'serviceName'])
+
+
+def test_get_validator_builds_separate_validators_for_different_required_fields():
+    validator = get_validator('services-g-cloud-7-scs', enforce_required=False,
+                              required_fields=['serviceName'])
+
+    assert validator is not get_validator('services-g-cloud-7-scs', enforce_required=False,
+                                          required_fields=['serviceSummary'])
+    assert validator is not get_validator('services-g-cloud-7-scs', enforce_required=False)
+    assert validator is not get_validator('services-g-cloud-7-scs')
+
+
+def test_cached_partial_validator_does_not_change_full_schema_validation():
+    data = load_example_listing("G7-SCS")
+    data.pop('serviceSummary')
+    get_validation_errors("services-g-cloud-7-scs", data, enforce_required=False)
+
+    errs = get_validation_errors("services-g-cloud-7-scs", data)
+
+    assert_equal(errs['serviceSummary'], 'answer_required')
+
+
+def test_validator_cache_evicts_least_recently_used_validator():
+    cache = ValidatorCache(maxsize=2)
+    cache.get('a', object)
+    first_b = cache.get('b', object)
+    cache.get('a', object)
+    cache.get('c', object)
+
+    assert_equal(len(cache), 2)
+    assert first_b is not cache.get('b', object)
+
+
+def test_validator_cache_is_per_thread():
+    cache = ValidatorCache(maxsize=2)
+    validator = cache.get('a', object)
+    other_thread_validators = []
+
+    thread = threading.Thread(target=lambda: other_thread_validators.append(cache.get('a', object)))
+    thread.start()
+    thread.join()
+
+    assert validator is cache.get('a', object)
+    assert validator is not other_thread_validators[0]
+
+
+def test_get_validator_gives_each_thread_its_own_validator_for_the_same_schema():
+    validators = []
+    thread = threading.Thread(target=lambda: validators.append(
+        get_validator('services-g-cloud-7-scs', enforce_required=False, required_fields=['serviceName'])
+    ))
+    thread.start()
+    thread.join()
+
+    validator = get_validator('services-g-cloud-7-scs', enforce_required=False, required_fields=['serviceName'])
+
+    assert validator is not validators[0]
+    assert validator.schema is validators[0].schema
+
+
+def test_schema_cache_keeps_the_first_schema_built():
+    cache = SchemaCache(maxsize=2)
+    first_a = cache.get('a', dict)
+
+    assert first_a is cache.get('a', dict)
+
+    cache.get('b', dict)
+    cache.get('c', dict)
+    assert first_a is not cache.get('a', dict)
+
+
 def test_additional_properties_has_validation_error():
     data = load_example_listing("G7-SCS")
     data = drop_api_exported_fields_so_that_api_import_will_validate(data)